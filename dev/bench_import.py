@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Startup time benchmark for seacargos subcommands.
+# For every subcommand starts fresh interpreters and reports median wall
+# time of loading its ETL module through seacargos cli (after) compared
+# with executing top level imports of the script at git revision REV
+# (before), default is the first commit of the repository. Subcommands
+# without script at REV are reported as "-".
+# ETL modules import access.py, so run it where one-line/access.py is
+# available, it is copied next to the scripts of REV.
+# Usage: python dev/bench_import.py [RUNS] [REV]
+
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ETL_DIR = os.path.join(ROOT, "one-line")
+
+sys.path.insert(0, ROOT)
+from seacargos.cli import COMMANDS
+
+CLI = ("from seacargos.cli import load_module; "
+       "load_module({command!r}, {etl_dir!r})")
+SCRIPT = ("import runpy, sys; sys.path.insert(0, {etl_dir!r}); "
+          "runpy.run_path({path!r}, run_name='bench')")
+
+def git(*args):
+    return subprocess.run(["git", *args], cwd=ROOT, check=True,
+                          capture_output=True).stdout
+
+def checkout(rev, target):
+    """Extract one-line directory of rev into target, return its path."""
+    archive = git("archive", "--format=tar", rev, "one-line")
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    etl_dir = os.path.join(target, "one-line")
+    access = os.path.join(ETL_DIR, "access.py")
+    if os.path.exists(access):
+        shutil.copy(access, etl_dir)
+    return etl_dir
+
+def run(code, runs):
+    """Median wall time in ms of running code in fresh interpreter."""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT,
+                       stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+def measure(code, runs):
+    try:
+        return run(code, runs)
+    except subprocess.CalledProcessError:
+        return None
+
+def show(value):
+    return f"{'failed':>11}" if value is None else f"{value:8.1f} ms"
+
+def main(args):
+    runs = int(args[0]) if args else 20
+    rev = args[1] if len(args) > 1 else\
+        git("rev-list", "--max-parents=0", "HEAD").split()[0].decode()
+    with tempfile.TemporaryDirectory() as target:
+        old_dir = checkout(rev, target)
+        print(f"{'interpreter':>12}: {show(measure('pass', runs))}")
+        print(f"{'command':>12}  {'before':>11}  {'after':>11}  {'ratio':>8}")
+        for command, (module, _, _) in COMMANDS.items():
+            path = os.path.join(old_dir, module + ".py")
+            after = measure(CLI.format(command=command, etl_dir=ETL_DIR),
+                            runs)
+            if not os.path.exists(path):
+                print(f"{command:>12}: {'-':>11}  {show(after)}")
+                continue
+            before = measure(SCRIPT.format(etl_dir=old_dir, path=path), runs)
+            ratio = f"{after / before:7.0%}" if after and before else ""
+            print(f"{command:>12}: {show(before)}  {show(after)}  {ratio:>8}")
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
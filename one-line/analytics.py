@@ -0,0 +1,120 @@
+# ETA analytics for one-line shippings.
+#
+# Every schedule write passes old and new schedule of a container to
+# record(), which keeps estimate history and updates rollups in place:
+#
+# revisions: {"tracking", "no", "date", "seen"}
+#            one document per new estimate of an event, tracking is _id
+#            of tracking document, as container numbers are reused
+# stats:     {"metric", "dim", "key", "n", "sum", "sumSq", "min", "max",
+#             "lastUpdate"}
+#            metric is "drift" (actual arrival minus first estimate) or
+#            "dwell" (actual departure minus actual arrival at one port),
+#            dim is "route", "port", "terminal" or "vessel",
+#            values are in hours.
+#
+# Dashboard reads aggregates with one indexed query, see
+# seacargos/analytics.py.
+
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, InsertOne, UpdateOne
+
+# Substrings of event names marking port calls
+ARRIVAL_MARKER = "Arrival"
+DEPARTURE_MARKER = "Departure"
+
+def ensure_indexes(db):
+    """Create indexes of revisions and stats collections."""
+    db.revisions.create_index(
+        [("tracking", ASCENDING), ("no", ASCENDING), ("seen", ASCENDING)]
+    )
+    db.stats.create_index(
+        [("metric", ASCENDING), ("dim", ASCENDING), ("key", ASCENDING)],
+        unique=True,
+    )
+    db.stats.create_index(
+        [("metric", ASCENDING), ("dim", ASCENDING), ("n", DESCENDING)]
+    )
+
+def hours(delta):
+    """Timedelta in hours."""
+    return delta.total_seconds() / 3600
+
+def stat_update(metric, dim, key, value, now):
+    """Upsert operation adding value to aggregate."""
+    return UpdateOne(
+        {"metric": metric, "dim": dim, "key": key},
+        {"$inc": {"n": 1, "sum": value, "sumSq": value * value},
+         "$min": {"min": value},
+         "$max": {"max": value},
+         "$set": {"lastUpdate": now}},
+        upsert=True,
+    )
+
+def route(schedule):
+    """Route key of schedule: first and last place names."""
+    if not schedule:
+        return None
+    return schedule[0].place_name + " > " + schedule[-1].place_name
+
+def first_estimate(db, tracking_id, event):
+    """Date of the first recorded estimate of schedule event."""
+    doc = db.revisions.find_one(
+        {"tracking": tracking_id, "no": event.no},
+        sort=[("seen", ASCENDING)],
+    )
+    return doc["date"] if doc else None
+
+def arrival_before(schedule, departure):
+    """Actual arrival at departure place preceding departure."""
+    arrival = None
+    for i in schedule:
+        if i.no >= departure.no:
+            break
+        if i.actual and i.place_name == departure.place_name\
+                and i.event.find(ARRIVAL_MARKER) > -1:
+            arrival = i
+    return arrival
+
+def record(db, tracking_id, old, new):
+    """Save estimate revisions and update rollups for change of
+    schedule of tracking document with tracking_id from old to new
+    (lists of ScheduleEvent)."""
+    now = datetime.now().replace(microsecond=0)
+    previous = {i.no: i for i in old or []}
+    revisions, stats = [], []
+    for event in new or []:
+        prev = previous.get(event.no)
+        if not event.actual:
+            # Keep every new estimate of an event
+            if prev is None or prev.actual or prev.date != event.date:
+                revisions.append(InsertOne({
+                    "tracking": tracking_id, "no": event.no,
+                    "date": event.date, "seen": now,
+                }))
+            continue
+        if prev is not None and prev.actual:
+            continue
+        # Event became actual
+        terminal = event.place_name + "|" + event.yard_name
+        if event.event.find(ARRIVAL_MARKER) > -1:
+            estimate = first_estimate(db, tracking_id, event)\
+                or (prev.date if prev else None)
+            if estimate:
+                drift = hours(event.date - estimate)
+                keys = [("route", route(new)), ("port", event.place_name),
+                        ("terminal", terminal), ("vessel", event.imo)]
+                stats += [stat_update("drift", dim, key, drift, now)
+                          for dim, key in keys if key]
+        elif event.event.find(DEPARTURE_MARKER) > -1:
+            arrival = arrival_before(new, event)
+            if arrival:
+                dwell = hours(event.date - arrival.date)
+                keys = [("port", event.place_name), ("terminal", terminal),
+                        ("vessel", event.imo)]
+                stats += [stat_update("dwell", dim, key, dwell, now)
+                          for dim, key in keys if key]
+    if revisions:
+        db.revisions.bulk_write(revisions, ordered=False)
+    if stats:
+        db.stats.bulk_write(stats, ordered=False)
@@ -0,0 +1,101 @@
+# Carrier adapter for one-line shippings (ONE).
+
+import time
+from datetime import datetime
+from carriers import Carrier, register, log
+from models import ScheduleEvent
+
+@register
+class OneCarrier(Carrier):
+    """Adapter for ecomm.one-line.com tracking endpoint."""
+
+    name = "one"
+    ref_fields = ["copNo"]
+
+    # External data resource
+    url = "https://ecomm.one-line.com/ecom/CUP_HOM_3301GS.do"
+
+    container_keys = ["cntrNo", "cntrTpszNm", "copNo", "blNo"]
+    schedule_keys = ["no", "statusNm", "placeNm", "yardNm",
+                     "eventDt", "actTpCd", "vslEngNm", "lloydNo"]
+
+    def extract_containers(self, bill_number):
+        """Request details of all containers for bill number."""
+        if not isinstance(bill_number, str):
+            log("[Carrier one] [Extract containers]"\
+                + f" [Wrong argument type {bill_number}]")
+            return False
+        # Create payload for get request
+        payload = {
+            '_search': 'false', 'nd': str(time.time_ns())[:-6],
+            'rows': '10000', 'page': '1', 'sidx': '',
+            'sord': 'asc', 'f_cmd': '121', 'search_type': 'A',
+            'search_name': bill_number, 'cust_cd': '',
+        }
+        # Run request and fetch json data
+        data = self.get(self.url, params=payload).json()
+        # Extract details data for every container of the bill
+        if "list" in data and len(data["list"]) > 0:
+            containers = data["list"]
+            # Remove unnecessary data
+            for container_details in containers:
+                if "hashColumns" in container_details:
+                    del container_details["hashColumns"]
+            return containers
+        else:
+            log("[Carrier one] [Extract containers]"\
+                + f" [No details data for {bill_number}]")
+            return False
+
+    def extract_schedule(self, record):
+        """Request schedule details for container."""
+        if not record:
+            return False
+        # Create payload for get request
+        payload = {
+            '_search': 'false', 'f_cmd': '125', 'cntr_no': record["cntrNo"],
+            'bkg_no': '', 'cop_no': record["copNo"]
+        }
+        # Run request and fetch json data
+        data = self.get(self.url, params=payload).json()
+        # Extract container schedule data
+        if "list" in data and len(data["list"]) > 0:
+            schedule_details = data["list"]
+            if "hashColumns" in schedule_details[0]:
+                del schedule_details[0]["hashColumns"]
+            return schedule_details
+        else:
+            log("[Carrier one] [Extract schedule]"\
+                + f" [No schedule for container {record['cntrNo']}]")
+            return False
+
+    def transform_container(self, raw):
+        """Normalize container details."""
+        if not raw or not set(self.container_keys).issubset(set(raw)):
+            log("[Carrier one] [Transform container]"\
+                + " [Keys do not match in container data]")
+            return False
+        return {
+            "cntrNo": raw["cntrNo"],
+            "cntrType": raw["cntrTpszNm"],
+            "copNo": raw["copNo"],
+            "blNo": raw["blNo"],
+            "carrier": self.name,
+        }
+
+    def transform_schedule(self, raw):
+        """Normalize schedule details."""
+        if not raw or not set(self.schedule_keys).issubset(set(raw[0])):
+            log("[Carrier one] [Transform schedule]"\
+                + " [Keys do not match in schedule data]")
+            return False
+        return [ScheduleEvent(
+            no=int(i["no"]),
+            event=i["statusNm"],
+            place_name=i["placeNm"],
+            yard_name=i["yardNm"],
+            date=datetime.strptime(i["eventDt"], "%Y-%m-%d %H:%M"),
+            status=i["actTpCd"],
+            vessel=i["vslEngNm"],
+            imo=i["lloydNo"],
+        ) for i in raw]
@@ -0,0 +1,149 @@
+# Carrier adapters for container tracking ETL.
+#
+# Every carrier is served by an adapter class derived from Carrier and
+# registered with @register. Adapters hide carrier endpoints and raw field
+# names from ETL scripts, which work with normalized documents only:
+#
+# container: {"cntrNo", "cntrType", "blNo", "carrier"} plus carrier
+#            specific reference fields listed in Carrier.ref_fields
+#            (stored in tracking document and used for schedule lookup)
+# schedule:  list of models.ScheduleEvent
+
+import importlib
+import threading
+import time
+from datetime import datetime
+
+# Carrier of tracking documents without carrier field
+DEFAULT_CARRIER = "one"
+
+# Modules with adapters shipped with ETL scripts
+ADAPTER_MODULES = ["carrier_one"]
+
+# Registered adapter classes: carrier name -> class
+ADAPTERS = {}
+
+# Number of local processes sharing rate limits of carriers, every
+# process gets its part of Carrier.rate_limit, see etl_update.py
+PROCESSES = 1
+
+def log(message):
+    """Log function to log errors."""
+    timestamp = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    with open("etl.log", "a") as f:
+        f.write(timestamp + " " + message + "\n")
+
+class RateLimiter:
+    """Thread-safe limiter of requests per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        """Block until next request is allowed."""
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+class Carrier:
+    """Base class of carrier adapters.
+
+    Subclasses set name and ref_fields and implement extract and
+    transform methods. Instances share one http session (connection
+    pool of max_workers connections) and one rate limiter.
+
+    rate_limit is shared by PROCESSES local processes, it is not
+    coordinated between machines: when ETL scripts run on several
+    machines at once, lower rate_limit accordingly."""
+
+    name = None
+    ref_fields = []
+    # Requests per second allowed by carrier endpoint
+    rate_limit = 5
+    # Concurrent requests to carrier endpoint
+    max_workers = 8
+    # Substrings of event names marking terminals
+    outbound_marker = "Outbound Terminal"
+    inbound_marker = "Inbound Terminal"
+
+    def __init__(self):
+        # Imported here, so scripts without carrier requests do not
+        # pay for it
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.limiter = RateLimiter(self.rate_limit / PROCESSES)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.max_workers
+        ))
+
+    def get(self, url, **kwargs):
+        """Rate limited get request."""
+        self.limiter.wait()
+        kwargs.setdefault("timeout", 30)
+        return self.session.get(url, **kwargs)
+
+    def extract_containers(self, bill_number):
+        """Return list of raw container details for bill number
+        or False."""
+        raise NotImplementedError
+
+    def extract_schedule(self, record):
+        """Return raw schedule for container record (raw container
+        details or tracking document) or False."""
+        raise NotImplementedError
+
+    def transform_container(self, raw):
+        """Return normalized container document or False."""
+        raise NotImplementedError
+
+    def transform_schedule(self, raw):
+        """Return normalized schedule or False."""
+        raise NotImplementedError
+
+    def terminals(self, schedule):
+        """Find outbound and inbound terminals in normalized schedule
+        as (place name, yard name)."""
+        outbound, inbound = None, None
+        for i in schedule:
+            if i.event.find(self.outbound_marker) > -1:
+                outbound = (i.place_name, i.yard_name)
+            if i.event.find(self.inbound_marker) > -1:
+                inbound = (i.place_name, i.yard_name)
+        return outbound, inbound
+
+def register(cls):
+    """Class decorator to register carrier adapter."""
+    ADAPTERS[cls.name] = cls
+    return cls
+
+def load_adapters():
+    """Import modules with shipped adapters."""
+    for module in ADAPTER_MODULES:
+        importlib.import_module(module)
+
+# Adapter instances: carrier name -> adapter
+_instances = {}
+_instances_lock = threading.Lock()
+
+def get(name=None):
+    """Return adapter instance for carrier name."""
+    name = name or DEFAULT_CARRIER
+    with _instances_lock:
+        if name not in _instances:
+            if name not in ADAPTERS:
+                load_adapters()
+            if name not in ADAPTERS:
+                raise KeyError(f"Unknown carrier {name}")
+            _instances[name] = ADAPTERS[name]()
+        return _instances[name]
+
+def names():
+    """Return names of all registered carriers."""
+    load_adapters()
+    return list(ADAPTERS)
@@ -4,16 +4,14 @@
 # Loads new records into one database, tracking and init collections.
 
 import sys
-import requests
-import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
-from bson.json_util import dumps
 import access
-
-# External data resource
-URL = "https://ecomm.one-line.com/ecom/CUP_HOM_3301GS.do"
+import carriers
+from models import Places, Tracking
+import analytics
 
 def log(message):
     """Log function to log errors."""
@@ -21,193 +19,140 @@ def log(message):
     with open("etl.log", "a") as f:
         f.write(timestamp + " " + message + "\n")
 
-def check_record(bill_number):
-    """Check that init and tracking database does not have container record yet."""
-    conn = MongoClient(access.init)
-    query = {"blNo": bill_number, "trackEnd": None}
+def check_records(bill_numbers, conn):
+    """Return bill numbers which init and tracking database do not have
+    container records for yet, checked with one query per collection."""
+    query = {"blNo": {"$in": list(bill_numbers)}, "trackEnd": None}
     try:
-        conn.admin.command("ping")
-        init = conn.one.init.count_documents(query)
-        tracking = conn.one.tracking.count_documents(query)
-        if init == 0 and tracking == 0:
-            conn.close()
-            return True
-        else:
-            conn.close()
-            log(f"[ETL Init] [Check record]"\
-                + f" [Record already exists for {bill_number}]")
-            return False
+        existing = set(conn.one.init.distinct("blNo", query))
+        existing.update(conn.one.tracking.distinct("blNo", query))
     except ConnectionFailure:
-        log("[ETL Init] [Check record]"\
-            + f" [DB Connection failure for {bill_number}]")
-        conn.close()
-        return False
+        log("[ETL Init] [Check records] [DB Connection failure]")
+        return []
     except BaseException as err:
-        log("[ETL Init] [Check record]"\
-            + f" [{err.details} for {bill_number}]")
-        conn.close()
-        return False
+        log(f"[ETL Init] [Check records] [{err}]")
+        return []
+    for bill_number in existing:
+        log(f"[ETL Init] [Check records]"\
+            + f" [Record already exists for {bill_number}]")
+    return [bill for bill in bill_numbers if bill not in existing]
 
-def extract_container_details(bill_number):
-    """Post request to extract container details."""
-    if isinstance(bill_number, str):
-        # Create payload for get request
-        payload = {
-            '_search': 'false', 'nd': str(time.time_ns())[:-6],
-            'rows': '10000', 'page': '1', 'sidx': '',
-            'sord': 'asc', 'f_cmd': '121', 'search_type': 'A',
-            'search_name': bill_number, 'cust_cd': '',
-        }
-        # Run request and fetch json data
-        r = requests.get(URL, params=payload)
-        data = r.json()
-        # Extract container details data
-        if "list" in data:
-            container_details = data["list"][0]
-            # Remove unnecessary data
-            if "hashColumns" in container_details:
-                del container_details["hashColumns"]
-            return container_details
-        else:
-            log(f"[ETL Init] [Extract container details]"\
-                + f" [No details data for {bill_number}]")
-            return False
-    else:
-        log("[ETL Init] [Extract container details]"\
-            + f" [Wrong argument type {bill_number}]")
-        return False
+def extract(bill_numbers, carrier):
+    """Extract container and schedule details for bill numbers and
+    yield one document per container.
 
-def extract_schedule_details(cntr_details):
-    """Extract schedule details."""
-    if cntr_details:
-        # Create payload for get request
-        payload = {
-            '_search': 'false', 'f_cmd': '125', 'cntr_no': cntr_details["cntrNo"],
-            'bkg_no': '', 'cop_no': cntr_details["copNo"]
+    Container lookups for all bills run concurrently, and every
+    container found immediately enqueues its schedule lookup, so up to
+    carrier.max_workers requests are in flight at any time."""
+    with ThreadPoolExecutor(max_workers=carrier.max_workers) as executor:
+        # Map of running futures to (bill number, container details)
+        pending = {
+            executor.submit(carrier.extract_containers, bill): (bill, None)
+            for bill in bill_numbers
         }
-        # Run request and fetch json data
-        r = requests.get(URL, params=payload)
-        data = r.json()
-        # Extract container schedule data
-        if "list" in data:
-            schedule_details = data["list"]
-            if "hashColumns" in schedule_details[0]:
-                del schedule_details[0]["hashColumns"]
-            return schedule_details
-        else:
-            log("[ETL Init] [Extract schedule details]"\
-                + f" [No schedule for container {cntr_details['cntrNo']}]")
-            return False
-    else: 
-        return False
-
-def extract(bill_number):
-    """Extract container and schedule details and
-    return one document."""
-    cntr_details = extract_container_details(bill_number)
-    schedule_details = extract_schedule_details(cntr_details)
-    if cntr_details and schedule_details:
-        return {"container": cntr_details,
-                "schedule": schedule_details,
-                "number": bill_number}
-    else:
-        log("[ETL Init] [Extract phase]"\
-            + f" [No data for {bill_number}]")
-        return False
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                bill_number, cntr_details = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as err:
+                    log("[ETL Init] [Extract phase]"\
+                        + f" [{err} for {bill_number}]")
+                    continue
+                if not result:
+                    log("[ETL Init] [Extract phase]"\
+                        + f" [No data for {bill_number}]")
+                elif cntr_details is None:
+                    # Container lookup finished: fan out schedule lookups
+                    for container in result:
+                        schedule = executor.submit(
+                            carrier.extract_schedule, container)
+                        pending[schedule] = (bill_number, container)
+                else:
+                    yield {"container": cntr_details,
+                           "schedule": result,
+                           "number": bill_number}
 
-def transform(data):
-    """Transforms raw data for database load."""
+def transform(data, carrier):
+    """Transforms raw data into tracking model for database load."""
     # Check data argument
     if not data:
         log("[ETL Init] [Transform]"\
             + f" [No raw data]")
         return False
-    # Check contnainer keys and extract container info
-    cntr_keys = ["cntrNo", "cntrTpszNm", "copNo", "blNo"]
-    if set(cntr_keys).issubset(set(data["container"])):
-        result = {
-            "cntrNo": data["container"]["cntrNo"],
-            "cntrType": data["container"]["cntrTpszNm"],
-            "copNo": data["container"]["copNo"],
-            "blNo": data["container"]["blNo"],
-            "trackStart": datetime.now().replace(microsecond=0),
-            "trackEnd": None,
-            "outboundTerminal": "",
-            "inboundTerminal": "",
-            "vesselName": None,
-            "location": None,
-            "schedule": None,
-        }
-    else:
+    # Normalize container info
+    container = carrier.transform_container(data["container"])
+    if not container:
         log("[ETL Init] [Transform]"\
             + f" [Keys do not match in container data {data['number']}]")
         return False
-    # Check schedule keys and extract schedule data
-    schedule_keys = ["no", "statusNm", "placeNm", "yardNm",
-                     "eventDt", "actTpCd", "actTpCd", "vslEngNm",
-                     "lloydNo"]
-    if set(schedule_keys).issubset(set(data["schedule"][0])):
-        schedule = [{
-            "no": int(i["no"]),
-            "event": i["statusNm"],
-            "placeName": i["placeNm"],
-            "yardName": i["yardNm"],
-            "eventDate": datetime.strptime(i["eventDt"], "%Y-%m-%d %H:%M"),
-            "status": i["actTpCd"],
-            "vesselName": i["vslEngNm"],
-            "imo": i["lloydNo"],
-        } for i in data["schedule"]]
-        result["schedule"] = schedule
-        # Find and save outbound and inbound terminals
-        for i in data["schedule"]:
-            if i["statusNm"].find("Outbound Terminal") > -1:
-                result["outboundTerminal"] = i["placeNm"]\
-                + "|" + i["yardNm"]
-            if i["statusNm"].find("Inbound Terminal") > -1:
-                result["inboundTerminal"] = i["placeNm"]\
-                + "|" + i["yardNm"]
-    else:
+    # Normalize schedule data
+    schedule = carrier.transform_schedule(data["schedule"])
+    if not schedule:
         log("[ETL Init] [Transform]"\
             + f" [Keys do not match in schedule data {data['number']}]")
         return False
-    return result
+    # Find outbound and inbound terminals
+    outbound, inbound = carrier.terminals(schedule)
+    return Tracking(
+        container["cntrNo"], container["cntrType"], container["blNo"],
+        container["carrier"],
+        refs={field: container[field] for field in carrier.ref_fields},
+        track_start=datetime.now().replace(microsecond=0),
+        outbound=outbound,
+        inbound=inbound,
+        schedule=schedule,
+    )
 
-def load(data):
-    """Loads data into init and tracking collections."""
+def load(data, conn, places):
+    """Loads tracking model into init and tracking collections."""
     # Check data argument
     if not data:
         log("[ETL Init] [Load] [No data to load]")
         return None
-    # Connect to database and load data
-    conn = MongoClient(access.init)
+    # Encode and load data
     try:
-        conn.admin.command("ping")
-        cur_init = conn.one.init.insert_one(data)
+        doc = data.to_bson(places)
+        cur_init = conn.one.init.insert_one(doc.copy())
         if cur_init.acknowledged == False:
             log("[ETL Init] [Load] "\
-                + f"[{data['blNo']} not loaded to init]")
-        cur_tracking = conn.one.tracking.insert_one(data)
+                + f"[{data.bl_no} not loaded to init]")
+        cur_tracking = conn.one.tracking.insert_one(doc)
         if cur_tracking.acknowledged == False:
             log("[ETL Init] [Load] "\
-                + f"[{data['blNo']} not loaded to tracking]")
-        conn.close()
+                + f"[{data.bl_no} not loaded to tracking]")
+        # Save initial estimates for ETA analytics
+        analytics.record(
+            conn.one, cur_tracking.inserted_id, [], data.schedule
+        )
     except ConnectionFailure:
         log("[ETL Init] [Load] "\
-            + f"[Connection failure for {data['blNo']}]")
-        conn.close()
+            + f"[Connection failure for {data.bl_no}]")
     except BaseException as err:
         log("[ETL Init] [Load] "\
-            + f"[{err.details} for {data['blNo']}]")
-        conn.close()
+            + f"[{err} for {data.bl_no}]")
 
 def main(args):
-    """Pipeline."""
+    """Pipeline. Arguments: [--carrier NAME] BILL_NUMBER..."""
+    name = None
+    if len(args) > 1 and args[0] == "--carrier":
+        name, args = args[1], args[2:]
     if len(args) > 0:
-        for arg in args:
-            if check_record(arg):
-                raw_data = extract(arg)
-                transformed_data = transform(raw_data)
-                load(transformed_data)
+        try:
+            carrier = carriers.get(name)
+        except KeyError as err:
+            log(f"[ETL Init] [Main] [{err}]")
+            return 1
+        conn = MongoClient(access.init)
+        try:
+            bill_numbers = check_records(dict.fromkeys(args), conn)
+            places = Places(conn.one)
+            for raw_data in extract(bill_numbers, carrier):
+                transformed_data = transform(raw_data, carrier)
+                load(transformed_data, conn, places)
+        finally:
+            conn.close()
 
 if __name__ == '__main__':
     sys.exit(main(sys.argv[1:]))
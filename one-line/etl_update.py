@@ -2,18 +2,27 @@
 
 # ETL update script for one-line shippings.
 # Updates records in one database, tracking collection.
+# Workers lease due records, so several instances can run at once.
 
 import sys
-import requests
-import json
-from datetime import datetime
-from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from pymongo import MongoClient, DESCENDING
 from pymongo.errors import ConnectionFailure
-from bson.json_util import dumps
 import access
+import carriers
+import leases
+from models import Places, ScheduleEvent, Status, migrated
+import analytics
 
-# External data resource
-URL = "https://ecomm.one-line.com/ecom/CUP_HOM_3301GS.do"
+# Number of records leased by worker at a time
+BATCH_SIZE = 50
+
+# Minimal interval between updates of one record in seconds
+UPDATE_INTERVAL = 3600
+
+# Minimal interval between attempts to update prioritized record
+PRIORITY_INTERVAL = 300
 
 def log(message):
     """Log function to log errors."""
@@ -21,22 +30,42 @@ def log(message):
     with open("etl.log", "a") as f:
         f.write(timestamp + " " + message + "\n")
 
-def records_to_update():
-    """Prepare records which require update."""
-    # Prepare connection, query and project fields
-    conn = MongoClient(access.update)
+def records_to_update(conn, owner):
+    """Lease next batch of records which require update to owner."""
+    # Prepare query and project fields
     now = datetime.now().replace(microsecond=0)
+    updated = now - timedelta(seconds=UPDATE_INTERVAL)
+    retried = now - timedelta(seconds=PRIORITY_INTERVAL)
+    # Containers with estimated events in the past, or signalled by
+    # geofence arrival detection, which come first
+    priority = {"refreshPriority": {"$gt": 0}}
     query = {
         "trackEnd": None,
-        "schedule": {"$elemMatch": {"status": "E", "eventDate": {"$lte": now}}}
+        "$and": [
+            {"$or": [
+                {"schedule": {"$elemMatch": {
+                    "status": int(Status.ESTIMATED), "date": {"$lte": now}}}},
+                priority,
+            ]},
+            {"$or": [
+                {"lastUpdate": None}, {"lastUpdate": {"$lt": updated}},
+                {**priority, "lastUpdate": {"$lt": retried}},
+            ]},
+        ],
     }
-    project = {"cntrNo": 1, "copNo": 1, "_id": 0}
+    project = {"cntrNo": 1, "carrier": 1, "schedule": 1}
+    for name in carriers.names():
+        for field in carriers.get(name).ref_fields:
+            project[field] = 1
     # Query database
     try:
-        conn.admin.command("ping")
-        cur = conn.one.tracking.find(query, project)
-        records = json.loads(dumps(cur))
-        conn.close()
+        records = leases.claim(
+            conn.one.tracking, owner, query, BATCH_SIZE, project,
+            sort=[("refreshPriority", DESCENDING)],
+        )
+        # Keep stored schedule for analytics
+        for rec in records:
+            rec["previous"] = rec.pop("schedule", None) or []
         if len(records) > 0:
             return records
         else:
@@ -44,103 +73,198 @@ def records_to_update():
     except ConnectionFailure:
         log("[ETL Update] [Records to update] "\
             + f"[DB Connection failure]")
-        conn.close()
         return False
     except BaseException as err:
         log("[ETL Update] [Records to update] "\
-            + f"[{err.details}]")
-        conn.close()
+            + f"[{err}]")
         return False
 
-def extract_schedule_details(records):
-    """Extract schedule details for update."""
+def group_by_carrier(records):
+    """Split records into lists per carrier name."""
+    groups = {}
+    if not records:
+        return groups
+    for rec in records:
+        name = rec.get("carrier") or carriers.DEFAULT_CARRIER
+        groups.setdefault(name, []).append(rec)
+    return groups
+
+def extract_schedule_details(records, carrier):
+    """Extract schedule details for update, up to carrier.max_workers
+    requests at a time."""
     # Check input
     if not records:
         return False
     # Extract data
-    for rec in records:
-        # Create payload for get request
-        payload = {
-            '_search': 'false', 'f_cmd': '125', 'cntr_no': rec["cntrNo"],
-            'bkg_no': '', 'cop_no': rec["copNo"]
-        }
-        # Run request and fetch json data
-        r = requests.get(URL, params=payload)
-        data = r.json()
-        # Extract container schedule data and clean
-        if "list" in data:
-            schedule_details = data["list"]
-            if "hashColumns" in schedule_details[0]:
-                del schedule_details[0]["hashColumns"]
-            rec["schedule"] = schedule_details
-        else:
-            log("[ETL Update] [Extract schedule details]"\
-                + f" [No schedule for container {rec['cntrNo']}]")
-            rec["schedule"] = None
+    with ThreadPoolExecutor(max_workers=carrier.max_workers) as executor:
+        futures = {executor.submit(carrier.extract_schedule, rec): rec
+                   for rec in records}
+        for future in as_completed(futures):
+            rec = futures[future]
+            try:
+                rec["schedule"] = future.result() or None
+            except Exception as err:
+                log("[ETL Update] [Extract schedule details]"\
+                    + f" [{err} for container {rec['cntrNo']}]")
+                rec["schedule"] = None
     return records
 
-def transform(records):
+def transform(records, carrier):
     """Transforms raw data for database load."""
     # Check input
     if not records:
         return False
-    # Check schedule keys and extract schedule data
-    schedule_keys = ["no", "statusNm", "placeNm", "yardNm",
-                     "eventDt", "actTpCd", "actTpCd", "vslEngNm",
-                     "lloydNo"]
+    # Normalize schedule data
     for rec in records:
-        if set(schedule_keys).issubset(set(rec["schedule"][0])):
-            schedule = [{
-                "no": int(i["no"]),
-                "event": i["statusNm"],
-                "placeName": i["placeNm"],
-                "yardName": i["yardNm"],
-                "eventDate": datetime.strptime(i["eventDt"], "%Y-%m-%d %H:%M"),
-                "status": i["actTpCd"],
-                "vesselName": i["vslEngNm"],
-                "imo": i["lloydNo"],
-            } for i in rec["schedule"]]
-            rec["schedule"] = schedule
-        else:
+        schedule = carrier.transform_schedule(rec["schedule"])
+        if not schedule:
             log("[ETL Update] [Transform] "\
                 + f"[Keys do not match in schedule data {rec['cntrNo']}]")
-            rec["schedule"] = None
+        rec["schedule"] = schedule or None
     return records
 
-def update(records):
-    """Update records in database."""
+def update(records, conn, owner, places):
+    """Update records leased to owner in database and release their
+    leases. Analytics are recorded only for records which update
+    matched, so a worker which lost its lease does not count schedule
+    changes twice."""
     # Check input
     if not records:
         return False
-    # Connect to database and update
+    for rec in records:
+        if not rec["schedule"]:
+            log("[ETL Update] [Update] "\
+            + f"[Not updated {rec['cntrNo']}]")
+            continue
+        query = {"_id": rec["_id"], "leaseOwner": owner}
+        change = {
+            "$set": {"schedule": [i.to_bson(places)
+                                  for i in rec["schedule"]],
+                     "lastUpdate": datetime.now().replace(microsecond=0)},
+            "$unset": {"leaseOwner": "", "leaseExpires": "",
+                       "refreshPriority": ""},
+        }
+        try:
+            cur = conn.one.tracking.update_one(query, change)
+            if cur.matched_count == 0:
+                log("[ETL Update] [Update] "\
+                + f"[Lease lost, {rec['cntrNo']} not updated in tracking]")
+                continue
+            # Save estimate revisions and update ETA rollups
+            previous = [ScheduleEvent.from_bson(i, places)
+                        for i in rec["previous"]]
+            analytics.record(
+                conn.one, rec["_id"], previous, rec["schedule"]
+            )
+        except ConnectionFailure:
+            log(f"[ETL Update] [Update] [Connection failure]")
+            return False
+        except BaseException as err:
+            log(f"[ETL Update] [Update] [{err} for {rec['cntrNo']}]")
+
+def update_carrier(name, records, conn, owner, places):
+    """Pipeline for records of one carrier."""
+    try:
+        carrier = carriers.get(name)
+    except KeyError as err:
+        log(f"[ETL Update] [Update carrier] [{err}]")
+        return
+    raw_records = extract_schedule_details(records, carrier)
+    transformed_records = transform(raw_records, carrier)
+    update(transformed_records, conn, owner, places)
+
+def update_batch(records, conn, owner, places):
+    """Update leased batch. Carriers are updated concurrently, each one
+    within its own rate limit, sharing one database connection pool.
+    Leases are renewed while batch is in progress and released when
+    it is done."""
+    groups = group_by_carrier(records)
+    ids = [rec["_id"] for rec in records]
+    with leases.Heartbeat(conn.one.tracking, owner, ids):
+        with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+            futures = {
+                executor.submit(
+                    update_carrier, name, group, conn, owner, places
+                ): name
+                for name, group in groups.items()
+            }
+            for future in as_completed(futures):
+                if future.exception():
+                    log("[ETL Update] [Update batch] "\
+                        + f"[{future.exception()} for carrier {futures[future]}]")
+    # Release records which were not updated, they are retried after
+    # UPDATE_INTERVAL, or PRIORITY_INTERVAL while refreshPriority is
+    # kept, it is removed only by successful update
+    leases.release(
+        conn.one.tracking, owner, ids,
+        lastUpdate=datetime.now().replace(microsecond=0),
+    )
+
+def check_migrated():
+    """Check that legacy documents were migrated, see models.migrated."""
     conn = MongoClient(access.update)
     try:
-        conn.admin.command("ping")
-        for rec in records:
-            if rec["schedule"]:
-                query = {"cntrNo": rec["cntrNo"]}
-                change = {"$set": {"schedule": rec["schedule"]}}
-                cur_tracking = conn.one.tracking.update_one(query, change)
-                if cur_tracking.acknowledged == False:
-                    log("[ETL Update] [Update] "\
-                    + f"[{rec['cntrNo']} not updated in tracking]")
-            else:
-                log("[ETL Update] [Update] "\
-                + f"[Not updated {rec['cntrNo']}]")
-        conn.close()
+        if migrated(conn.one):
+            return True
+        log("[ETL Update] [Check migrated] "\
+            + "[Legacy documents found, run migrate_models.py first]")
     except ConnectionFailure:
-        log(f"[ETL Update] [Update] [Connection failure]")
+        log("[ETL Update] [Check migrated] [DB Connection failure]")
+    except BaseException as err:
+        log(f"[ETL Update] [Check migrated] [{err}]")
+    finally:
         conn.close()
+    return False
+
+def worker(processes=1):
+    """Claim and update batches until no due records are left.
+    Carrier rate limits are shared by processes local workers."""
+    carriers.PROCESSES = processes
+    owner = leases.worker_id()
+    conn = MongoClient(access.update)
+    places = Places(conn.one)
+    try:
+        conn.admin.command("ping")
+        leases.ensure_indexes(conn.one.tracking)
+        conn.one.tracking.create_index([("refreshPriority", DESCENDING)])
+        analytics.ensure_indexes(conn.one)
+        leases.recover(conn.one.tracking)
+        while True:
+            records = records_to_update(conn, owner)
+            if not records:
+                break
+            update_batch(records, conn, owner, places)
+    except ConnectionFailure:
+        log(f"[ETL Update] [Worker] [Connection failure]")
     except BaseException as err:
-        log(f"[ETL Update] [Update] [{err}]")
+        log(f"[ETL Update] [Worker] [{err}]")
+    finally:
         conn.close()
 
-def main():
-	"""Pipeline."""
-	records = records_to_update()
-	raw_records = extract_schedule_details(records)
-	transformed_records = transform(raw_records)
-	update(transformed_records)
+def main(args):
+	"""Pipeline. Arguments: [--workers N] to run N local worker processes.
+	Any number of instances may run on several machines at once."""
+	workers = 1
+	if len(args) > 0 and args[0] == "--workers":
+		try:
+			workers = int(args[1])
+		except (IndexError, ValueError):
+			workers = 0
+		if workers < 1:
+			log(f"[ETL Update] [Main] [Invalid --workers value {' '.join(args[1:2])}]")
+			return 1
+	if not check_migrated():
+		return 1
+	if workers == 1:
+		worker()
+		return
+	from multiprocessing import Process
+	processes = [Process(target=worker, args=(workers,))
+		for _ in range(workers)]
+	for process in processes:
+		process.start()
+	for process in processes:
+		process.join()
 
 if __name__ == '__main__':
-	sys.exit(main())
\ No newline at end of file
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,168 @@
+# Geofence arrival detection for one-line shippings.
+#
+# Port and terminal polygons are loaded from GEOFENCES_FILE, a GeoJSON
+# FeatureCollection of Polygon/MultiPolygon features with properties
+# {"name": <place name as in schedule>, "yard": <yard name, optional>}.
+# Polygons are indexed in a regular lon/lat grid, so every vessel
+# position is tested only against polygons of its grid cell and of the
+# destinations of containers aboard.
+#
+# Containers whose vessel is inside a destination polygon get
+# arrivalSignal and refreshPriority fields in tracking collection;
+# etl_update refreshes them first.
+
+import json
+import math
+from datetime import datetime
+from pymongo import UpdateOne
+
+# Polygons of ports and terminals
+GEOFENCES_FILE = "geofences.geojson"
+
+# Grid cell size in degrees
+CELL_SIZE = 1.0
+
+class Fence:
+    """Polygon of one port or terminal."""
+
+    __slots__ = ("name", "yard", "polygons", "bbox")
+
+    def __init__(self, name, yard, polygons):
+        self.name = name
+        self.yard = yard
+        # List of polygons, each a list of rings of (lon, lat),
+        # the first ring is outer boundary, the others are holes
+        self.polygons = polygons
+        points = [p for polygon in polygons for p in polygon[0]]
+        self.bbox = (min(p[0] for p in points), min(p[1] for p in points),
+                     max(p[0] for p in points), max(p[1] for p in points))
+
+    def contains(self, lon, lat):
+        """Check that point is inside fence."""
+        if not (self.bbox[0] <= lon <= self.bbox[2]
+                and self.bbox[1] <= lat <= self.bbox[3]):
+            return False
+        for polygon in self.polygons:
+            if in_ring(lon, lat, polygon[0]) and\
+                    not any(in_ring(lon, lat, hole) for hole in polygon[1:]):
+                return True
+        return False
+
+def in_ring(lon, lat, ring):
+    """Ray casting test of point in closed ring."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and\
+                lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+def load_fences(path=GEOFENCES_FILE):
+    """Load fences from GeoJSON file."""
+    with open(path) as f:
+        data = json.load(f)
+    fences = []
+    for feature in data["features"]:
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            continue
+        properties = feature.get("properties") or {}
+        fences.append(Fence(properties["name"], properties.get("yard", ""),
+                            polygons))
+    return fences
+
+class GridIndex:
+    """Fences indexed by grid cells covered by their bounding boxes."""
+
+    def __init__(self, fences, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        for fence in fences:
+            x0, y0 = self.cell(fence.bbox[0], fence.bbox[1])
+            x1, y1 = self.cell(fence.bbox[2], fence.bbox[3])
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    self.cells.setdefault((x, y), []).append(fence)
+
+    def cell(self, lon, lat):
+        return (math.floor(lon / self.cell_size),
+                math.floor(lat / self.cell_size))
+
+    def candidates(self, lon, lat):
+        return self.cells.get(self.cell(lon, lat), [])
+
+def arrivals(index, positions, destinations):
+    """Find containers which vessels are inside destination fences.
+
+    positions:    {imo: (lon, lat)}
+    destinations: {imo: {cntrNo: destination place name}}
+    Return {cntrNo: fence}."""
+    result = {}
+    for imo, (lon, lat) in positions.items():
+        aboard = destinations.get(imo)
+        if not aboard:
+            continue
+        names = set(aboard.values())
+        # Only fences of destinations in the position cell are tested
+        for fence in index.candidates(lon, lat):
+            if fence.name in names and fence.contains(lon, lat):
+                for cntr_no, name in aboard.items():
+                    if name == fence.name:
+                        result[cntr_no] = fence
+                names.discard(fence.name)
+    return result
+
+def destination(doc, places):
+    """Destination place name of tracking document: inbound terminal
+    or place of the last schedule event."""
+    if doc.get("inbound") is not None:
+        return places.get(doc["inbound"])[0]
+    if doc.get("schedule"):
+        return places.get(doc["schedule"][-1]["place"])[0]
+    return None
+
+def signal_arrivals(db, places, ships, index):
+    """Check located ships against destinations of containers aboard and
+    mark containers which arrived. Return number of marked containers.
+
+    ships: [{"cntrNo", "imo", "location": [lon, lat]}, ...]"""
+    positions, aboard = {}, {}
+    for ship in ships:
+        if "" in ship["location"]:
+            continue
+        positions[ship["imo"]] = tuple(ship["location"])
+        aboard.setdefault(ship["imo"], []).append(ship["cntrNo"])
+    if not positions:
+        return 0
+    cntr_imo = {c: imo for imo, cntrs in aboard.items() for c in cntrs}
+    destinations = {}
+    cur = db.tracking.find(
+        {"cntrNo": {"$in": list(cntr_imo)}, "trackEnd": None,
+         "arrivalSignal": None},
+        {"cntrNo": 1, "inbound": 1, "schedule": {"$slice": -1}},
+    )
+    for doc in cur:
+        name = destination(doc, places)
+        if name:
+            imo = cntr_imo[doc["cntrNo"]]
+            destinations.setdefault(imo, {})[doc["cntrNo"]] = name
+    now = datetime.now().replace(microsecond=0)
+    operations = [UpdateOne(
+        {"cntrNo": cntr_no, "trackEnd": None, "arrivalSignal": None},
+        {"$set": {
+            "arrivalSignal": {"date": now, "place": fence.name,
+                              "yard": fence.yard},
+            "refreshPriority": 1,
+        }},
+    ) for cntr_no, fence in arrivals(index, positions, destinations).items()]
+    if not operations:
+        return 0
+    return db.tracking.bulk_write(operations, ordered=False).modified_count
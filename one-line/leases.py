@@ -0,0 +1,118 @@
+# Work leases for ETL workers.
+#
+# Workers claim documents by setting leaseOwner and leaseExpires with
+# atomic find_one_and_update, so several workers on any number of
+# machines never process the same document at the same time. A lease is
+# renewed while work is in progress and released when work is done.
+# Leases of crashed workers expire and can be claimed again.
+
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import PyMongoError
+
+# Lease duration in seconds
+LEASE_SECONDS = 600
+
+def worker_id():
+    """Unique name of worker process."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def expiry():
+    """Expiry time of lease taken now."""
+    return datetime.now().replace(microsecond=0)\
+        + timedelta(seconds=LEASE_SECONDS)
+
+def free(now):
+    """Query for documents without valid lease."""
+    return {"$or": [
+        {"leaseExpires": None},
+        {"leaseExpires": {"$lt": now}},
+    ]}
+
+def ensure_indexes(collection):
+    """Create index used by lease queries."""
+    collection.create_index([("leaseExpires", ASCENDING)])
+
+def claim(collection, owner, query, limit, projection=None, sort=None):
+    """Lease up to limit documents matching query to owner and
+    return them."""
+    now = datetime.now().replace(microsecond=0)
+    query = {"$and": [query, free(now)]}
+    change = {"$set": {"leaseOwner": owner, "leaseExpires": expiry()}}
+    records = []
+    while len(records) < limit:
+        doc = collection.find_one_and_update(
+            query, change,
+            projection=projection,
+            sort=sort,
+            return_document=ReturnDocument.AFTER,
+        )
+        if doc is None:
+            break
+        records.append(doc)
+    return records
+
+def renew(collection, owner, ids):
+    """Extend leases of owner on documents with ids."""
+    if not ids:
+        return 0
+    cur = collection.update_many(
+        {"_id": {"$in": list(ids)}, "leaseOwner": owner},
+        {"$set": {"leaseExpires": expiry()}},
+    )
+    return cur.modified_count
+
+def release(collection, owner, ids, unset=(), **fields):
+    """Release leases of owner on documents with ids, remove unset
+    fields and set fields."""
+    if not ids:
+        return 0
+    change = {"$unset": {"leaseOwner": "", "leaseExpires": ""}}
+    for field in unset:
+        change["$unset"][field] = ""
+    if fields:
+        change["$set"] = fields
+    cur = collection.update_many(
+        {"_id": {"$in": list(ids)}, "leaseOwner": owner}, change
+    )
+    return cur.modified_count
+
+def recover(collection):
+    """Release leases abandoned by crashed workers."""
+    now = datetime.now().replace(microsecond=0)
+    cur = collection.update_many(
+        {"leaseExpires": {"$lt": now}},
+        {"$unset": {"leaseOwner": "", "leaseExpires": ""}},
+    )
+    return cur.modified_count
+
+class Heartbeat:
+    """Context manager renewing leases in background thread."""
+
+    def __init__(self, collection, owner, ids, interval=LEASE_SECONDS / 3):
+        self.collection = collection
+        self.owner = owner
+        self.ids = list(ids)
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                renew(self.collection, self.owner, self.ids)
+            except PyMongoError:
+                # Lease expires and is recovered by another worker
+                pass
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
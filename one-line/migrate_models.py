@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Migration script for one-line shippings.
+# Rewrites documents of one database, tracking, init and ships
+# collections, written before models.py into compact model documents.
+
+import sys
+from datetime import datetime
+from pymongo import MongoClient, ReplaceOne
+from pymongo.errors import ConnectionFailure
+import access
+from models import LEGACY_TRACKING, Places, Ship, Tracking
+
+# Number of documents replaced with one bulk write
+BATCH_SIZE = 500
+
+# Legacy ships documents
+LEGACY_SHIPS = {"$or": [
+    {"update": {"$exists": True}},
+    {"ship_id": {"$exists": True}},
+    {"vesselName": {"$exists": True}},
+    {"mmsi": {"$type": "string"}},
+    {"imo": {"$type": "string"}},
+]}
+
+def log(message):
+    """Log function to log errors."""
+    timestamp = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    with open("etl.log", "a") as f:
+        f.write(timestamp + " " + message + "\n")
+
+def migrate(collection, query, convert):
+    """Replace documents matching query with converted documents
+    in batches. Return number of replaced documents."""
+    count = 0
+    batch = []
+    for doc in collection.find(query):
+        batch.append(ReplaceOne({"_id": doc["_id"]}, convert(doc)))
+        if len(batch) == BATCH_SIZE:
+            count += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        count += collection.bulk_write(batch, ordered=False).modified_count
+    return count
+
+def main():
+    """Pipeline."""
+    conn = MongoClient(access.update)
+    try:
+        conn.admin.command("ping")
+        places = Places(conn.one)
+        places.ensure_indexes()
+        places.load()
+        def convert_tracking(doc):
+            return Tracking.from_bson(doc, places).to_bson(places)
+        def convert_ship(doc):
+            return Ship.from_bson(doc).to_bson()
+        for name in ["tracking", "init"]:
+            count = migrate(conn.one[name], LEGACY_TRACKING, convert_tracking)
+            log(f"[Migrate models] [{name}] [{count} documents migrated]")
+        count = migrate(conn.one.ships, LEGACY_SHIPS, convert_ship)
+        log(f"[Migrate models] [ships] [{count} documents migrated]")
+        conn.close()
+    except ConnectionFailure:
+        log("[Migrate models] [DB Connection failure]")
+        conn.close()
+    except BaseException as err:
+        log(f"[Migrate models] [{err}]")
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main())
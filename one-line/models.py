@@ -0,0 +1,295 @@
+# Document models of one database collections.
+#
+# Model objects use __slots__ and encode to compact BSON documents:
+# schedule events use short keys, statuses are stored as small integers,
+# and place/yard pairs are interned in places collection and referenced
+# by integer id. Empty optional fields are not stored at all.
+#
+# tracking: {"cntrNo", "cntrType", "blNo", "carrier", <carrier refs>,
+#            "trackStart", "trackEnd"?, "outbound"?, "inbound"?,
+#            "vesselName"?, "location"?, "schedule": [event, ...]}
+# event:    {"no", "event", "place", "date", "status", "vessel"?, "imo"?}
+# places:   {"_id", "name", "yard"}
+# ships:    {"imo", "mmsi", "name"?, "type"?, "flag"?, "callSign"?,
+#            "shipId"?, "lastUpdate"}
+
+import sys
+import threading
+from datetime import datetime
+from enum import IntEnum
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+# Tracking and init documents written before models, rewritten by
+# migrate_models.py
+LEGACY_TRACKING = {"$or": [
+    {"schedule.eventDate": {"$exists": True}},
+    {"outboundTerminal": {"$exists": True}},
+]}
+
+def log(message):
+    """Log function to log errors."""
+    timestamp = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    with open("etl.log", "a") as f:
+        f.write(timestamp + " " + message + "\n")
+
+def migrated(db):
+    """Check that tracking collection has no legacy documents, which
+    queries of ETL scripts do not match. Result is remembered in
+    migrations collection, so the collection is scanned only until
+    migrate_models.py has run."""
+    if db.migrations.find_one({"_id": "models"}):
+        return True
+    if db.tracking.find_one(LEGACY_TRACKING, {"_id": 1}):
+        return False
+    db.migrations.update_one(
+        {"_id": "models"},
+        {"$set": {"date": datetime.now().replace(microsecond=0)}},
+        upsert=True,
+    )
+    return True
+
+class Status(IntEnum):
+    """Schedule event status."""
+    ESTIMATED = 0
+    ACTUAL = 1
+
+    @classmethod
+    def from_code(cls, code):
+        """Status from carrier one-letter code or stored value,
+        unknown codes are logged and read as estimated."""
+        if code in ("A", cls.ACTUAL):
+            return cls.ACTUAL
+        if code not in ("E", cls.ESTIMATED):
+            log(f"[Models] [Status] [Unknown status code {code!r}]")
+        return cls.ESTIMATED
+
+class Places:
+    """Interned place/yard pairs stored in places collection."""
+
+    def __init__(self, db):
+        self.collection = db.places
+        self.counters = db.counters
+        self.ids = {}
+        self.names = {}
+        self.lock = threading.Lock()
+
+    def ensure_indexes(self):
+        """Create unique index on place and yard names."""
+        self.collection.create_index(
+            [("name", ASCENDING), ("yard", ASCENDING)], unique=True
+        )
+
+    def remember(self, doc):
+        """Cache place document."""
+        key = (sys.intern(doc["name"]), sys.intern(doc["yard"]))
+        self.ids[key] = doc["_id"]
+        self.names[doc["_id"]] = key
+
+    def id(self, name, yard):
+        """Return id of place, create place if it does not exist."""
+        key = (name or "", yard or "")
+        with self.lock:
+            if key in self.ids:
+                return self.ids[key]
+        doc = self.collection.find_one({"name": key[0], "yard": key[1]})
+        if doc is None:
+            counter = self.counters.find_one_and_update(
+                {"_id": "places"}, {"$inc": {"seq": 1}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            doc = {"_id": counter["seq"], "name": key[0], "yard": key[1]}
+            try:
+                self.collection.insert_one(doc)
+            except DuplicateKeyError:
+                # Created by concurrent process in the meantime
+                doc = self.collection.find_one(
+                    {"name": key[0], "yard": key[1]}
+                )
+        with self.lock:
+            self.remember(doc)
+        return doc["_id"]
+
+    def get(self, place_id):
+        """Return (name, yard) for place id."""
+        with self.lock:
+            if place_id in self.names:
+                return self.names[place_id]
+        doc = self.collection.find_one({"_id": place_id})
+        if doc is None:
+            return ("", "")
+        with self.lock:
+            self.remember(doc)
+        return self.names[place_id]
+
+    def load(self):
+        """Cache all places."""
+        with self.lock:
+            for doc in self.collection.find():
+                self.remember(doc)
+
+class ScheduleEvent:
+    """One event of container schedule."""
+
+    __slots__ = ("no", "event", "place_name", "yard_name", "date",
+                 "status", "vessel", "imo")
+
+    def __init__(self, no, event, place_name, yard_name, date,
+                 status, vessel=None, imo=None):
+        self.no = no
+        self.event = sys.intern(event)
+        self.place_name = sys.intern(place_name or "")
+        self.yard_name = sys.intern(yard_name or "")
+        self.date = date
+        self.status = Status.from_code(status)
+        self.vessel = sys.intern(vessel) if vessel else None
+        self.imo = int(imo) if imo and str(imo).isdigit() else None
+
+    @property
+    def actual(self):
+        return self.status == Status.ACTUAL
+
+    def to_bson(self, places):
+        """Encode to compact document."""
+        doc = {
+            "no": self.no,
+            "event": self.event,
+            "place": places.id(self.place_name, self.yard_name),
+            "date": self.date,
+            "status": int(self.status),
+        }
+        if self.vessel:
+            doc["vessel"] = self.vessel
+        if self.imo:
+            doc["imo"] = self.imo
+        return doc
+
+    @classmethod
+    def from_bson(cls, doc, places):
+        """Decode compact or legacy document."""
+        if "eventDate" in doc:
+            return cls(doc["no"], doc["event"], doc["placeName"],
+                       doc["yardName"], doc["eventDate"], doc["status"],
+                       doc.get("vesselName"), doc.get("imo"))
+        name, yard = places.get(doc["place"])
+        return cls(doc["no"], doc["event"], name, yard, doc["date"],
+                   doc["status"], doc.get("vessel"), doc.get("imo"))
+
+class Tracking:
+    """Tracked container with its schedule."""
+
+    __slots__ = ("cntr_no", "cntr_type", "bl_no", "carrier", "refs",
+                 "track_start", "track_end", "outbound", "inbound",
+                 "vessel_name", "location", "schedule")
+
+    # Fields stored in tracking document by model
+    fields = {"_id", "cntrNo", "cntrType", "blNo", "carrier", "trackStart",
+              "trackEnd", "outbound", "inbound", "outboundTerminal",
+              "inboundTerminal", "vesselName", "location", "schedule"}
+
+    def __init__(self, cntr_no, cntr_type, bl_no, carrier, refs=None,
+                 track_start=None, track_end=None, outbound=None,
+                 inbound=None, vessel_name=None, location=None,
+                 schedule=None):
+        self.cntr_no = cntr_no
+        self.cntr_type = sys.intern(cntr_type)
+        self.bl_no = bl_no
+        self.carrier = sys.intern(carrier)
+        # Carrier specific reference fields, e.g. copNo, and fields
+        # maintained by other ETL stages
+        self.refs = refs or {}
+        self.track_start = track_start
+        self.track_end = track_end
+        # Terminals as (place name, yard name)
+        self.outbound = outbound
+        self.inbound = inbound
+        self.vessel_name = vessel_name
+        self.location = location
+        self.schedule = schedule or []
+
+    def to_bson(self, places):
+        """Encode to compact document."""
+        doc = {
+            "cntrNo": self.cntr_no,
+            "cntrType": self.cntr_type,
+            "blNo": self.bl_no,
+            "carrier": self.carrier,
+            **self.refs,
+            "trackStart": self.track_start,
+            "schedule": [i.to_bson(places) for i in self.schedule],
+        }
+        if self.track_end:
+            doc["trackEnd"] = self.track_end
+        if self.outbound:
+            doc["outbound"] = places.id(*self.outbound)
+        if self.inbound:
+            doc["inbound"] = places.id(*self.inbound)
+        if self.vessel_name:
+            doc["vesselName"] = self.vessel_name
+        if self.location:
+            doc["location"] = self.location
+        return doc
+
+    @classmethod
+    def from_bson(cls, doc, places, default_carrier="one"):
+        """Decode compact or legacy document."""
+        def terminal(key, legacy_key):
+            if doc.get(key) is not None:
+                return places.get(doc[key])
+            if doc.get(legacy_key):
+                return tuple(doc[legacy_key].split("|", 1))
+            return None
+        return cls(
+            doc["cntrNo"], doc.get("cntrType", ""), doc.get("blNo"),
+            doc.get("carrier") or default_carrier,
+            refs={k: v for k, v in doc.items() if k not in cls.fields},
+            track_start=doc.get("trackStart"),
+            track_end=doc.get("trackEnd"),
+            outbound=terminal("outbound", "outboundTerminal"),
+            inbound=terminal("inbound", "inboundTerminal"),
+            vessel_name=doc.get("vesselName"),
+            location=doc.get("location"),
+            schedule=[ScheduleEvent.from_bson(i, places)
+                      for i in doc.get("schedule") or []],
+        )
+
+class Ship:
+    """Ship of ships collection."""
+
+    __slots__ = ("imo", "mmsi", "name", "type", "flag", "call_sign",
+                 "ship_id", "last_update")
+
+    def __init__(self, imo, mmsi, name=None, type=None, flag=None,
+                 call_sign=None, ship_id=None, last_update=None):
+        self.imo = int(imo) if imo and str(imo).isdigit() else 0
+        self.mmsi = int(mmsi) if mmsi and str(mmsi).isdigit() else 0
+        self.name = name
+        self.type = type
+        self.flag = flag
+        self.call_sign = call_sign
+        self.ship_id = ship_id
+        self.last_update = last_update
+
+    def to_bson(self):
+        """Encode to compact document."""
+        doc = {"imo": self.imo, "mmsi": self.mmsi}
+        for key, value in (("name", self.name), ("type", self.type),
+                           ("flag", self.flag), ("callSign", self.call_sign),
+                           ("shipId", self.ship_id),
+                           ("lastUpdate", self.last_update)):
+            if value is not None and value != "":
+                doc[key] = value
+        return doc
+
+    @classmethod
+    def from_bson(cls, doc):
+        """Decode document written by any ETL script."""
+        return cls(
+            doc.get("imo"), doc.get("mmsi"),
+            name=doc.get("name") or doc.get("vesselName"),
+            type=doc.get("type"),
+            flag=doc.get("flag"),
+            call_sign=doc.get("callSign"),
+            ship_id=doc.get("shipId", doc.get("ship_id")),
+            last_update=doc.get("lastUpdate", doc.get("update")),
+        )
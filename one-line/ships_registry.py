@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# Ships registry script for one-line shippings.
+# Keeps one database, ships collection, as one document per vessel
+# (models.Ship) with unique imo and mmsi, merges records with upserts
+# and streams bulk import/export in NDJSON or BSON files.
+# Usage: ships_registry.py import|export PATH
+#        ships_registry.py dedup
+
+import sys
+from datetime import datetime
+import bson
+from bson import json_util
+from pymongo import MongoClient, ReplaceOne, UpdateOne, ASCENDING
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+import access
+from models import Ship
+
+# Number of ships written with one bulk write
+CHUNK_SIZE = 1000
+
+def log(message):
+    """Log function to log errors."""
+    timestamp = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    with open("etl.log", "a") as f:
+        f.write(timestamp + " " + message + "\n")
+
+# Databases which indexes were ensured by this process
+_indexed = set()
+
+def ensure_indexes(db):
+    """Create unique indexes on known imo and mmsi numbers."""
+    db.ships.create_index(
+        [("imo", ASCENDING)], unique=True,
+        partialFilterExpression={"imo": {"$gt": 0}},
+    )
+    db.ships.create_index(
+        [("mmsi", ASCENDING)], unique=True,
+        partialFilterExpression={"mmsi": {"$gt": 0}},
+    )
+
+def merge_operation(ship):
+    """Upsert operation merging ship into registry: known fields
+    overwrite stored ones, lastUpdate keeps the latest date."""
+    if ship.imo:
+        query = {"imo": ship.imo}
+    elif ship.mmsi:
+        query = {"mmsi": ship.mmsi}
+    else:
+        return None
+    doc = ship.to_bson()
+    last_update = doc.pop("lastUpdate", None)
+    # Unknown numbers must not overwrite known ones
+    for key in ("imo", "mmsi"):
+        if not doc[key]:
+            del doc[key]
+    change = {"$set": doc}
+    if last_update:
+        change["$max"] = {"lastUpdate": last_update}
+    return UpdateOne(query, change, upsert=True)
+
+def merge_docs(docs):
+    """Merge ship documents in order: later known values win,
+    lastUpdate keeps the latest date."""
+    merged = {}
+    for doc in docs:
+        for field, value in Ship.from_bson(doc).to_bson().items():
+            if not value:
+                continue
+            if field == "lastUpdate" and merged.get(field)\
+                    and merged[field] > value:
+                continue
+            merged[field] = value
+    return merged
+
+def replace_merged(db, docs, merged):
+    """Write merged into the newest of docs (sorted by lastUpdate) and
+    delete the others. Numbers of the others are freed first, so merged
+    record is written before any record is deleted."""
+    ids = [d["_id"] for d in docs[:-1]]
+    if ids:
+        db.ships.update_many({"_id": {"$in": ids}},
+                             {"$set": {"imo": 0, "mmsi": 0}})
+    db.ships.replace_one({"_id": docs[-1]["_id"]}, merged)
+    if ids:
+        db.ships.delete_many({"_id": {"$in": ids}})
+
+def merge_conflict(db, ship):
+    """Merge ship with every record holding its imo or mmsi, e.g. a
+    record created earlier from mmsi only. Return True when merged."""
+    numbers = [{key: value} for key, value
+               in (("imo", ship.imo), ("mmsi", ship.mmsi)) if value]
+    docs = list(db.ships.find({"$or": numbers})
+                .sort("lastUpdate", ASCENDING))
+    if not docs:
+        return False
+    replace_merged(db, docs, merge_docs(docs + [ship.to_bson()]))
+    return True
+
+def ensure_indexes_once(db):
+    """Ensure indexes once per process. Registry with duplicates gets
+    no unique indexes until dedup has run, which is logged."""
+    if db.name in _indexed:
+        return
+    _indexed.add(db.name)
+    try:
+        ensure_indexes(db)
+    except PyMongoError as err:
+        log("[Ships registry] [Ensure indexes] "\
+            + f"[{err}, run ships_registry.py dedup]")
+
+def upsert(db, ships):
+    """Merge ships into registry. Return number of merged ships."""
+    ships = [ship for ship in ships if ship.imo or ship.mmsi]
+    operations = [merge_operation(ship) for ship in ships]
+    if not operations:
+        return 0
+    ensure_indexes_once(db)
+    try:
+        cur = db.ships.bulk_write(operations, ordered=False)
+        return cur.upserted_count + cur.matched_count
+    except BulkWriteError as err:
+        count = err.details["nUpserted"] + err.details["nMatched"]
+        for error in err.details["writeErrors"]:
+            # Imo and mmsi of one ship belong to two records
+            if error["code"] == 11000:
+                try:
+                    if merge_conflict(db, ships[error["index"]]):
+                        count += 1
+                        continue
+                except PyMongoError as merge_err:
+                    error = {"errmsg": str(merge_err)}
+            log("[Ships registry] [Upsert] "\
+                + f"[{error['errmsg']}]")
+        return count
+
+def chunks(iterable, size=CHUNK_SIZE):
+    """Split iterable into lists of size."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def read_file(path):
+    """Stream ship documents from NDJSON or BSON file."""
+    if path.endswith(".bson"):
+        with open(path, "rb") as f:
+            yield from bson.decode_file_iter(f)
+    else:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    yield json_util.loads(line)
+
+def import_file(db, path):
+    """Merge ships from file into registry in chunks."""
+    count = 0
+    ships = (Ship.from_bson(doc) for doc in read_file(path))
+    for chunk in chunks(ships):
+        count += upsert(db, chunk)
+    return count
+
+def export_file(db, path):
+    """Write registry to NDJSON or BSON file."""
+    count = 0
+    cur = db.ships.find({}, {"_id": 0}, batch_size=CHUNK_SIZE)
+    if path.endswith(".bson"):
+        with open(path, "wb") as f:
+            for doc in cur:
+                f.write(bson.encode(doc))
+                count += 1
+    else:
+        with open(path, "w") as f:
+            for doc in cur:
+                f.write(json_util.dumps(doc) + "\n")
+                count += 1
+    return count
+
+def merge_duplicates(db, key):
+    """Merge records with the same key into one."""
+    count = 0
+    cur = db.ships.aggregate([
+        {"$match": {key: {"$gt": 0}}},
+        {"$group": {"_id": f"${key}", "ids": {"$push": "$_id"},
+                    "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    for group in cur:
+        docs = list(db.ships.find({"_id": {"$in": group["ids"]}})
+                    .sort("lastUpdate", ASCENDING))
+        replace_merged(db, docs, merge_docs(docs))
+        count += len(docs) - 1
+    return count
+
+def dedup(db):
+    """Normalize legacy records, merge duplicates and create indexes."""
+    cur = db.ships.find(batch_size=CHUNK_SIZE)
+    for chunk in chunks(cur):
+        db.ships.bulk_write([
+            ReplaceOne({"_id": doc["_id"]}, Ship.from_bson(doc).to_bson())
+            for doc in chunk
+        ], ordered=False)
+    count = merge_duplicates(db, "imo") + merge_duplicates(db, "mmsi")
+    ensure_indexes(db)
+    return count
+
+def main(args):
+    """Pipeline."""
+    if not args or args[0] not in ("import", "export", "dedup")\
+            or (args[0] != "dedup" and len(args) != 2):
+        print("Usage: ships_registry.py import|export PATH\n"
+              "       ships_registry.py dedup", file=sys.stderr)
+        return 2
+    conn = MongoClient(access.update)
+    try:
+        conn.admin.command("ping")
+        if args[0] == "import":
+            ensure_indexes(conn.one)
+            count = import_file(conn.one, args[1])
+        elif args[0] == "export":
+            count = export_file(conn.one, args[1])
+        else:
+            count = dedup(conn.one)
+        log(f"[Ships registry] [{args[0].capitalize()}] [{count} ships]")
+        conn.close()
+    except ConnectionFailure:
+        log(f"[Ships registry] [{args[0].capitalize()}] "\
+            + "[DB Connection failure]")
+        conn.close()
+    except BaseException as err:
+        log(f"[Ships registry] [{args[0].capitalize()}] [{err}]")
+        conn.close()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -5,6 +5,8 @@ from datetime import datetime
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 import access
+from models import Ship
+import ships_registry
 from bs4 import BeautifulSoup
 import sys
 
@@ -65,7 +67,7 @@ def scrap_ship_details(title, ship_id):
     return result
 
 def insert_ship_to_db(ship):
-    """Insert ship record to db."""
+    """Merge ship record into ships registry."""
     if not ship:
         return
     # Connect to database and update data
@@ -73,9 +75,11 @@ def insert_ship_to_db(ship):
     try:
         conn.admin.command("ping")
         now = datetime.now().replace(microsecond=0)
-        ship["update"] = now
-        cur = conn.one.ships.insert_one(ship)
-        if cur.acknowledged == False:
+        record = Ship(ship["imo"], ship["mmsi"], name=ship["name"],
+                      type=ship["type"], flag=ship["flag"],
+                      call_sign=ship["callSign"], ship_id=ship["ship_id"],
+                      last_update=now)
+        if ships_registry.upsert(conn.one, [record]) == 0:
             log("[ships_web_scrapper.py] [insert_ship_to_db()] "\
                 + f"[Ship id {ship['ship_id']} imo {ship['imo']} not inserted]")
         conn.close()
@@ -11,6 +11,7 @@ from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 from bson.json_util import dumps
 import access
+from models import Status, migrated
 
 def log(message):
     """Log function to log errors."""
@@ -22,7 +23,7 @@ def containers_at_destination():
     """Find containers which reached point of destination."""
     # Prepare connection
     conn = MongoClient(access.track_end)
-    # Query database: count all documents with status=A and
+    # Query database: count all documents with actual status and
     # compare with total number of documents.
     try:
         conn.admin.command("ping")
@@ -33,7 +34,7 @@ def containers_at_destination():
                     "$filter": {
                         "input": "$schedule",
                         "as": "item",
-                        "cond": {"$eq": ["$$item.status", "A"]}
+                        "cond": {"$eq": ["$$item.status", int(Status.ACTUAL)]}
             }}}},
             {"$redact": {
                 "$cond": {
@@ -69,7 +70,7 @@ def set_track_end(data):
     # Close records
     try:
         conn.admin.command("ping")
-        for item in data:
+        for rec in data:
             cur = conn.one.tracking.update_one(
                 {"cntrNo": rec["cntrNo"]},
                 {"$set": {"trackEnd": datetime.now().replace(microsecond=0)}},
@@ -89,8 +90,26 @@ def set_track_end(data):
         conn.close()
         return False
 
+def check_migrated():
+    """Check that legacy documents were migrated, see models.migrated."""
+    conn = MongoClient(access.track_end)
+    try:
+        if migrated(conn.one):
+            return True
+        log("[Tracking closer] [Check migrated] "\
+            + "[Legacy documents found, run migrate_models.py first]")
+    except ConnectionFailure:
+        log("[Tracking closer] [Check migrated] [DB Connection failure]")
+    except BaseException as err:
+        log(f"[Tracking closer] [Check migrated] [{err}]")
+    finally:
+        conn.close()
+    return False
+
 def main():
 	"""Pipeline."""
+	if not check_migrated():
+		return 1
 	containers = containers_at_destination()
 	set_track_end(containers)
 
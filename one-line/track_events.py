@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+# Track events script for one-line shippings.
+# Watches change stream on one database, tracking collection, derives
+# container events (departed, arrived, ETA slipped, arrival signalled,
+# tracking ended) and dispatches them in batches to registered sinks.
+# Delivery is at-least-once: resume token is saved to one database,
+# resume_tokens collection, only after a batch reached every sink.
+
+import sys
+import time
+from datetime import datetime
+from pymongo import MongoClient
+from pymongo.errors import ConnectionFailure, PyMongoError
+from bson.json_util import dumps
+import access
+from models import Places, ScheduleEvent
+
+# Name of this change stream consumer in resume_tokens collection
+CONSUMER = "track_events"
+
+# Maximum number of events in one batch
+BATCH_SIZE = 100
+
+# Time to wait for new changes before dispatching incomplete batch
+BATCH_WAIT_MS = 1000
+
+# Delay before retrying a batch which failed to reach sinks
+RETRY_DELAY = 10
+
+# Attempts to deliver a batch before watching stops without saving
+# resume token, so the batch is delivered again on next start
+MAX_ATTEMPTS = 30
+
+# Sinks settings
+EVENTS_FILE = "events.ndjson"
+WEBHOOK_URL = getattr(access, "webhook", None)
+
+def log(message):
+    """Log function to log errors."""
+    timestamp = datetime.strftime(datetime.now(), "%Y-%m-%d %H:%M:%S")
+    with open("etl.log", "a") as f:
+        f.write(timestamp + " " + message + "\n")
+
+def file_sink(events):
+    """Append events to EVENTS_FILE, one json document per line."""
+    with open(EVENTS_FILE, "a") as f:
+        for event in events:
+            f.write(dumps(event) + "\n")
+
+def webhook_sink(events):
+    """Post events to WEBHOOK_URL as one json array."""
+    if not WEBHOOK_URL:
+        raise ValueError("Webhook url is not configured")
+    import requests
+    r = requests.post(
+        WEBHOOK_URL,
+        data=dumps(events),
+        headers={"Content-Type": "application/json"},
+        timeout=30,
+    )
+    r.raise_for_status()
+
+def queue_sink(events):
+    """Insert events into one database, events collection."""
+    conn = MongoClient(access.update)
+    try:
+        conn.one.events.insert_many([event.copy() for event in events])
+    finally:
+        conn.close()
+
+# Registered sinks: name -> function taking a list of events
+SINKS = {
+    "file": file_sink,
+    "webhook": webhook_sink,
+    "queue": queue_sink,
+}
+
+def register_sink(name, sink):
+    """Register sink function under name."""
+    SINKS[name] = sink
+
+def schedule_by_no(document, places):
+    """Return decoded document schedule as dict with event number keys."""
+    if not document or not document.get("schedule"):
+        return {}
+    return {i["no"]: ScheduleEvent.from_bson(i, places)
+            for i in document["schedule"]}
+
+def make_event(event_type, document, item=None, **extra):
+    """Create event for container document and schedule item."""
+    event = {
+        "type": event_type,
+        "cntrNo": document["cntrNo"],
+        "blNo": document.get("blNo"),
+        "detected": datetime.now().replace(microsecond=0),
+    }
+    if item:
+        event["event"] = item.event
+        event["placeName"] = item.place_name
+        event["yardName"] = item.yard_name
+        event["eventDate"] = item.date
+    event.update(extra)
+    return event
+
+def derive_events(before, after, places):
+    """Compare tracking document before and after change and
+    return list of container events. Without document before change
+    (insert, or missing pre-image) transitions are unknown and no
+    events are derived, so past events are never sent again."""
+    if not after or not before:
+        return []
+    events = []
+    old = schedule_by_no(before, places)
+    for no, item in schedule_by_no(after, places).items():
+        prev = old.get(no)
+        # Estimated event became actual
+        if item.actual and (prev is None or not prev.actual):
+            if item.event.find("Departure") > -1:
+                events.append(make_event("departed", after, item))
+            elif item.event.find("Arrival") > -1:
+                events.append(make_event("arrived", after, item))
+        # Estimated arrival moved to a later date
+        elif not item.actual and prev is not None and not prev.actual\
+                and item.event.find("Arrival") > -1\
+                and item.date > prev.date:
+            events.append(make_event(
+                "eta_slipped", after, item, previousDate=prev.date,
+            ))
+    # Vessel entered destination geofence, see geofence.py
+    if after.get("arrivalSignal") and not before.get("arrivalSignal"):
+        events.append(make_event(
+            "arrival_signalled", after, **after["arrivalSignal"]
+        ))
+    if after.get("trackEnd") and not before.get("trackEnd"):
+        events.append(make_event(
+            "tracking_ended", after, trackEnd=after["trackEnd"]
+        ))
+    return events
+
+def dispatch(events, sinks):
+    """Send events to every sink, retry up to MAX_ATTEMPTS times.
+    Return True when all sinks succeeded."""
+    if not events:
+        return True
+    remaining = list(sinks)
+    for attempt in range(MAX_ATTEMPTS):
+        if attempt > 0:
+            time.sleep(RETRY_DELAY)
+        for name in list(remaining):
+            try:
+                SINKS[name](events)
+                remaining.remove(name)
+            except Exception as err:
+                log("[Track events] [Dispatch] "\
+                    + f"[{err} for sink {name}, {len(events)} events]")
+        if not remaining:
+            return True
+    return False
+
+def load_resume_token(conn):
+    """Get saved resume token for CONSUMER."""
+    doc = conn.one.resume_tokens.find_one({"_id": CONSUMER})
+    return doc["token"] if doc else None
+
+def save_resume_token(conn, token):
+    """Save resume token for CONSUMER."""
+    conn.one.resume_tokens.update_one(
+        {"_id": CONSUMER},
+        {"$set": {"token": token,
+                  "lastUpdate": datetime.now().replace(microsecond=0)}},
+        upsert=True,
+    )
+
+def enable_pre_images(conn):
+    """Enable pre-images on tracking collection so that change stream
+    events carry document before change."""
+    try:
+        conn.one.command(
+            "collMod", "tracking",
+            changeStreamPreAndPostImages={"enabled": True},
+        )
+    except PyMongoError as err:
+        log("[Track events] [Enable pre-images] "\
+            + f"[{err}]")
+
+def watch(sinks):
+    """Watch tracking collection and dispatch events until stopped.
+    Return False when stopped by an error."""
+    conn = MongoClient(access.update)
+    pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+    try:
+        conn.admin.command("ping")
+        enable_pre_images(conn)
+        places = Places(conn.one)
+        token = load_resume_token(conn)
+        with conn.one.tracking.watch(
+            pipeline,
+            full_document="updateLookup",
+            full_document_before_change="whenAvailable",
+            resume_after=token,
+            max_await_time_ms=BATCH_WAIT_MS,
+        ) as stream:
+            batch = []
+            while stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    before = change.get("fullDocumentBeforeChange")
+                    if before is None\
+                            and change["operationType"] != "insert":
+                        log("[Track events] [Watch] "\
+                            + "[No pre-image, change skipped for "\
+                            + f"{change['documentKey']['_id']}]")
+                    batch.extend(derive_events(
+                        before, change.get("fullDocument"), places,
+                    ))
+                    if len(batch) < BATCH_SIZE:
+                        continue
+                # Batch is full or stream is idle: deliver and save position
+                last_token = stream.resume_token
+                if batch or last_token != token:
+                    if not dispatch(batch, sinks):
+                        log("[Track events] [Watch] "\
+                            + f"[Stopped, {len(batch)} events not delivered]")
+                        conn.close()
+                        return False
+                    save_resume_token(conn, last_token)
+                    token = last_token
+                    batch = []
+        conn.close()
+        return True
+    except ConnectionFailure:
+        log("[Track events] [Watch] [DB Connection failure]")
+        conn.close()
+        return False
+    except BaseException as err:
+        log(f"[Track events] [Watch] [{err}]")
+        conn.close()
+        return False
+
+def main(args):
+    """Pipeline."""
+    sinks = args if len(args) > 0 else ["file"]
+    unknown = [name for name in sinks if name not in SINKS]
+    if unknown:
+        log(f"[Track events] [Main] [Unknown sinks {', '.join(unknown)}]")
+        return 1
+    if "webhook" in sinks and not WEBHOOK_URL:
+        log("[Track events] [Main] [Webhook url is not configured]")
+        return 1
+    return 0 if watch(sinks) else 1
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
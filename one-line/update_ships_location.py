@@ -5,14 +5,13 @@
 # Adds ships information to one database, ships collection (imo, mmsi vesselName).
 
 import sys
-import requests
 import json
 from datetime import datetime
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 from bson.json_util import dumps
-from bs4 import BeautifulSoup
 import access
+from models import Status, migrated
 
 def log(message):
     """Log function to log errors."""
@@ -29,16 +28,16 @@ def ships_to_update():
     {"$match": {"trackEnd": None}},
     {"$unwind": "$schedule"},
     {"$match": {
-        "schedule.status": "A",
-        "schedule.eventDate": {"$lte": now},
-        "schedule.imo": {"$ne": ""}}
+        "schedule.status": int(Status.ACTUAL),
+        "schedule.date": {"$lte": now},
+        "schedule.imo": {"$gt": 0}}
     },
     # Group by cntrNo, add maxNo and push all items into array
     {"$group": {
         "_id": "$cntrNo",
         "maxNo": {"$max": "$schedule.no"},
         "items": {"$push": {
-            "vesselName": "$schedule.vesselName",
+            "vesselName": "$schedule.vessel",
             "imo": "$schedule.imo",
             "no": "$schedule.no"}}}
     },
@@ -85,6 +84,8 @@ def ships_to_update():
 def get_mmsi_from_web(imo):
     """Get mmsi number from https://www.shiplocation.com
     using imo number."""
+    import requests
+    from bs4 import BeautifulSoup
     # Get mmsi number from website
     url = "https://www.shiplocation.com/vessels?"
     payload = {"page": "1", "vessel": imo, "sort": "none",
@@ -112,18 +113,19 @@ def get_mmsi_from_web(imo):
                 + f"[{r.status_code} for imo {imo}]")
 
 def insert_ship_to_db(ship):
-    """Insert ship record to db."""
+    """Merge ship record into ships registry."""
+    import ships_registry
+    from models import Ship
     # Connect to database and update data
     conn = MongoClient(access.update)
     try:
         conn.admin.command("ping")
         now = datetime.now().replace(microsecond=0)
-        ship_copy = ship.copy()
-        del ship_copy["cntrNo"]
-        ship_copy["lastUpdate"] = now
-        cur = conn.one.ships.insert_one(ship_copy)
+        record = Ship(ship["imo"], ship["mmsi"], name=ship["vesselName"],
+                      last_update=now)
+        count = ships_registry.upsert(conn.one, [record])
         conn.close()
-        if cur.acknowledged == False:
+        if count == 0:
             log("[Update ship location] [Insert ship to db] "\
                 + f"[Imo {ship['imo']} not inserted]")
     except ConnectionFailure:
@@ -154,7 +156,7 @@ def get_mmsi(ships):
             cur = conn.one.ships.find({"imo": ship["imo"]})
             now = datetime.now().replace(microsecond=0)
             db_data = json.loads(dumps(cur))
-            if len(db_data) == 0:
+            if len(db_data) == 0 or not db_data[0].get("mmsi"):
                 mmsi = get_mmsi_from_web(ship["imo"])
                 if mmsi:
                     ship["mmsi"] = mmsi
@@ -162,7 +164,7 @@ def get_mmsi(ships):
                 else:
                     log("[Update ship location] [Get mmsi] "\
                         + f"[MMSI for imo {ship['imo']} not inserted to db]")
-            elif len(db_data) == 1:
+            else:
                 ship["mmsi"] = db_data[0]["mmsi"]
         except ConnectionFailure:
             log("[Update ship location] [Get mmsi] "\
@@ -177,6 +179,7 @@ def get_mmsi(ships):
 def parse_lon_lat(html):
     """Get latitude and longitute from
     https://www.vesselfinder.com raw html."""
+    from bs4 import BeautifulSoup
     soup = BeautifulSoup(html, "html.parser")
     location = []
     for i in ["coordinate lon", "coordinate lat"]:
@@ -198,6 +201,7 @@ def get_ships_location(ships):
         log("[Update ship location] [Get ships location] "\
             + "[No input arguments]")
         return False
+    import requests
     # Run get requests for locations
     base_url = "https://www.vesselfinder.com/vessels/{}-IMO-{}-MMSI-{}"
     headers = {"User-Agent": "Mozilla/5.0"}
@@ -249,12 +253,56 @@ def update(ships):
         log(f"[Update ship location] [Update] [{err}]")
         conn.close()
 
+def signal_arrivals(ships):
+    """Mark containers which vessels entered destination geofences
+    for priority schedule refresh."""
+    if not ships:
+        return
+    import geofence
+    from models import Places
+    try:
+        index = geofence.GridIndex(geofence.load_fences())
+    except (OSError, ValueError, KeyError) as err:
+        log("[Update ship location] [Signal arrivals] "\
+            + f"[Geofences not loaded: {err}]")
+        return
+    conn = MongoClient(access.update)
+    try:
+        conn.admin.command("ping")
+        geofence.signal_arrivals(conn.one, Places(conn.one), ships, index)
+        conn.close()
+    except ConnectionFailure:
+        log(f"[Update ship location] [Signal arrivals] [Connection failure]")
+        conn.close()
+    except BaseException as err:
+        log(f"[Update ship location] [Signal arrivals] [{err}]")
+        conn.close()
+
+def check_migrated():
+    """Check that legacy documents were migrated, see models.migrated."""
+    conn = MongoClient(access.update)
+    try:
+        if migrated(conn.one):
+            return True
+        log("[Update ship location] [Check migrated] "\
+            + "[Legacy documents found, run migrate_models.py first]")
+    except ConnectionFailure:
+        log("[Update ship location] [Check migrated] [DB Connection failure]")
+    except BaseException as err:
+        log(f"[Update ship location] [Check migrated] [{err}]")
+    finally:
+        conn.close()
+    return False
+
 def main():
 	"""Pipeline."""
+	if not check_migrated():
+		return 1
 	ships = ships_to_update()
 	ships_with_mmsi = get_mmsi(ships)
 	ships_with_location = get_ships_location(ships_with_mmsi)
 	update(ships_with_location)
+	signal_arrivals(ships_with_location)
 
 if __name__ == '__main__':
 	sys.exit(main())
\ No newline at end of file
@@ -1,9 +1,10 @@
 import os
 
-from flask import Flask
-
 
 def create_app(test_config=None):
+    # flask is imported here so that importing seacargos.cli stays cheap
+    from flask import Flask
+
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
     app.config.from_mapping(
@@ -33,5 +34,13 @@ def create_app(test_config=None):
     app.register_blueprint(home.bp)
     app.add_url_rule('/', endpoint='index')
 
+    # Register ETA analytics blueprint
+    from . import analytics
+    app.register_blueprint(analytics.bp)
+
+    # Register tracking blueprint served from in-process cache
+    from . import tracking
+    app.register_blueprint(tracking.bp)
+
     
     return app
\ No newline at end of file
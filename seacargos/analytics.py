@@ -0,0 +1,52 @@
+import math
+
+from flask import Blueprint, jsonify, render_template, request
+from pymongo import DESCENDING
+from werkzeug.exceptions import abort
+
+from seacargos.db import get_conn
+
+bp = Blueprint('analytics', __name__, url_prefix='/analytics')
+
+METRICS = ('drift', 'dwell')
+DIMENSIONS = ('route', 'port', 'terminal', 'vessel')
+
+
+def summary(metric, dim, limit):
+    """Read precomputed aggregates from stats collection."""
+    conn = get_conn()
+    cur = conn.one.stats.find(
+        {'metric': metric, 'dim': dim},
+        {'_id': 0, 'key': 1, 'n': 1, 'sum': 1, 'sumSq': 1,
+         'min': 1, 'max': 1},
+    ).sort('n', DESCENDING).limit(limit)
+    rows = []
+    for doc in cur:
+        mean = doc['sum'] / doc['n']
+        variance = max(doc['sumSq'] / doc['n'] - mean * mean, 0)
+        rows.append({
+            'key': doc['key'], 'n': doc['n'], 'mean': round(mean, 1),
+            'std': round(math.sqrt(variance), 1),
+            'min': round(doc['min'], 1), 'max': round(doc['max'], 1),
+        })
+    return rows
+
+
+@bp.route('/')
+def index():
+    return render_template(
+        'analytics/index.html', metrics=METRICS, dimensions=DIMENSIONS
+    )
+
+
+@bp.route('/<metric>/<dim>')
+def stats(metric, dim):
+    if metric not in METRICS or dim not in DIMENSIONS:
+        abort(404)
+    limit = request.args.get('limit', 50, type=int)
+    rows = summary(metric, dim, min(limit, 1000))
+    if request.args.get('format') == 'json':
+        return jsonify(rows)
+    return render_template(
+        'analytics/stats.html', metric=metric, dim=dim, rows=rows
+    )
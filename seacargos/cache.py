@@ -0,0 +1,277 @@
+"""In-process snapshot of tracking collection.
+
+Active containers are loaded once and kept fresh by a background thread
+tailing the tracking change stream, so views read them from memory.
+Without change streams (standalone server, missing privileges) the
+snapshot is reloaded every retry_delay instead. Closed containers are
+read through from the database on demand and kept in a bounded LRU,
+unknown container numbers in a bounded negative cache.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.exceptions import abort
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+log = logging.getLogger(__name__)
+
+# Schedule event status of actual event, see one-line/models.py,
+# documents not migrated yet store "A"
+ACTUAL = 1
+LEGACY_ACTUAL = 'A'
+
+# Fields of tracking documents kept in cache
+PROJECTION = {
+    'cntrNo': 1, 'blNo': 1, 'cntrType': 1, 'carrier': 1,
+    'trackStart': 1, 'trackEnd': 1, 'vesselName': 1, 'location': 1,
+    'schedule': 1,
+}
+
+
+class Entry:
+    """Compact state of one container."""
+
+    __slots__ = ('doc_id', 'cntr_no', 'bl_no', 'cntr_type', 'carrier', 'track_start',
+                 'track_end', 'vessel_name', 'imo', 'location',
+                 'last_event', 'last_date', 'eta')
+
+    def __init__(self, doc):
+        self.doc_id = doc.get('_id')
+        self.cntr_no = doc['cntrNo']
+        self.bl_no = doc.get('blNo')
+        self.cntr_type = doc.get('cntrType')
+        self.carrier = doc.get('carrier')
+        self.track_start = doc.get('trackStart')
+        self.track_end = doc.get('trackEnd')
+        self.vessel_name = doc.get('vesselName')
+        self.location = doc.get('location')
+        self.imo = None
+        self.last_event = None
+        self.last_date = None
+        self.eta = None
+        schedule = doc.get('schedule') or []
+        for item in schedule:
+            if item.get('status') in (ACTUAL, LEGACY_ACTUAL):
+                self.last_event = item['event']
+                self.last_date = item.get('date', item.get('eventDate'))
+                self.imo = item.get('imo') or self.imo
+        last = schedule[-1] if schedule else {}
+        if last and last.get('status') not in (ACTUAL, LEGACY_ACTUAL):
+            self.eta = last.get('date', last.get('eventDate'))
+
+    def to_dict(self):
+        return {
+            'cntrNo': self.cntr_no, 'blNo': self.bl_no,
+            'cntrType': self.cntr_type, 'carrier': self.carrier,
+            'trackStart': self.track_start, 'trackEnd': self.track_end,
+            'vesselName': self.vessel_name, 'imo': self.imo,
+            'location': self.location, 'lastEvent': self.last_event,
+            'lastDate': self.last_date, 'eta': self.eta,
+        }
+
+
+class TrackingCache:
+    """Active containers indexed by cntrNo, blNo and vessel imo."""
+
+    def __init__(self, uri, max_closed=10000, max_missing=10000,
+                 retry_delay=10):
+        self.conn = MongoClient(uri)
+        self.max_closed = max_closed
+        self.max_missing = max_missing
+        self.retry_delay = retry_delay
+        self.lock = threading.RLock()
+        self.active = {}
+        self.closed = OrderedDict()
+        # Container numbers not found in database, and number of
+        # applied changes, so a lookup racing a change is not cached
+        self.missing = OrderedDict()
+        self.changes = 0
+        self.by_bl = {}
+        self.by_imo = {}
+        # Document _id -> cntrNo of cached containers, to apply deletes
+        self.ids = {}
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    # Index maintenance, called with lock held
+
+    def _unindex(self, entry):
+        for index, key in ((self.by_bl, entry.bl_no),
+                           (self.by_imo, entry.imo)):
+            keys = index.get(key)
+            if keys is not None:
+                keys.discard(entry.cntr_no)
+                if not keys:
+                    del index[key]
+
+    def _remove(self, cntr_no, doc_id=None):
+        """Remove entry of cntr_no, only if it is of document doc_id
+        when given."""
+        for entries in (self.active, self.closed):
+            entry = entries.get(cntr_no)
+            if entry is None or doc_id is not None and entry.doc_id != doc_id:
+                continue
+            del entries[cntr_no]
+            if entries is self.active:
+                self._unindex(entry)
+            self.ids.pop(entry.doc_id, None)
+
+    def _remember_closed(self, entry):
+        self.closed[entry.cntr_no] = entry
+        while len(self.closed) > self.max_closed:
+            _, evicted = self.closed.popitem(last=False)
+            self.ids.pop(evicted.doc_id, None)
+
+    def _apply(self, doc):
+        try:
+            entry = Entry(doc)
+        except (KeyError, TypeError) as err:
+            log.warning('Tracking cache skips document %s: %r',
+                        doc.get('_id'), err)
+            return
+        self.changes += 1
+        self.missing.pop(entry.cntr_no, None)
+        if entry.track_end:
+            # Container number may be reused: a closed document never
+            # replaces active entry of another document
+            active = self.active.get(entry.cntr_no)
+            if active is not None and active.doc_id != entry.doc_id:
+                return
+            self._remove(entry.cntr_no)
+            self.ids[entry.doc_id] = entry.cntr_no
+            self._remember_closed(entry)
+            return
+        self._remove(entry.cntr_no)
+        self.ids[entry.doc_id] = entry.cntr_no
+        self.active[entry.cntr_no] = entry
+        if entry.bl_no:
+            self.by_bl.setdefault(entry.bl_no, set()).add(entry.cntr_no)
+        if entry.imo:
+            self.by_imo.setdefault(entry.imo, set()).add(entry.cntr_no)
+
+    # Loading and tailing
+
+    def load(self):
+        """Replace snapshot with active containers from database."""
+        cur = self.conn.one.tracking.find({'trackEnd': None}, PROJECTION)
+        docs = list(cur)
+        with self.lock:
+            self.active, self.by_bl, self.by_imo = {}, {}, {}
+            self.closed, self.ids = OrderedDict(), {}
+            self.missing = OrderedDict()
+            for doc in docs:
+                self._apply(doc)
+        self.ready.set()
+
+    def tail(self):
+        """Apply changes until change stream fails."""
+        pipeline = [{'$match': {'operationType': {
+            '$in': ['insert', 'update', 'replace', 'delete']}}}]
+        # Open stream before loading snapshot, so no change is missed
+        with self.conn.one.tracking.watch(
+            pipeline, full_document='updateLookup'
+        ) as stream:
+            self.load()
+            for change in stream:
+                doc = change.get('fullDocument')
+                with self.lock:
+                    if doc is not None:
+                        self._apply(doc)
+                    elif change['operationType'] == 'delete':
+                        doc_id = change['documentKey']['_id']
+                        cntr_no = self.ids.get(doc_id)
+                        if cntr_no is not None:
+                            self._remove(cntr_no, doc_id)
+
+    def run(self):
+        while True:
+            try:
+                self.tail()
+            except PyMongoError as err:
+                log.warning('Tracking cache stream failed: %s', err)
+            except Exception:
+                # Keep cache alive on unexpected documents or bugs,
+                # snapshot is reloaded on retry
+                log.exception('Tracking cache failed')
+            # Snapshot does not depend on change stream being available
+            try:
+                self.load()
+            except Exception:
+                log.exception('Tracking cache load failed')
+            time.sleep(self.retry_delay)
+
+    # Lookups
+
+    def get(self, cntr_no):
+        """Container state, closed containers are read through."""
+        with self.lock:
+            entry = self.active.get(cntr_no)
+            if entry is not None:
+                return entry
+            entry = self.closed.get(cntr_no)
+            if entry is not None:
+                self.closed.move_to_end(cntr_no)
+                return entry
+            if cntr_no in self.missing:
+                self.missing.move_to_end(cntr_no)
+                return None
+            changes = self.changes
+        doc = self.conn.one.tracking.find_one(
+            {'cntrNo': cntr_no}, PROJECTION, sort=[('trackStart', -1)])
+        with self.lock:
+            if doc is None:
+                if changes != self.changes:
+                    return None
+                self.missing[cntr_no] = True
+                while len(self.missing) > self.max_missing:
+                    self.missing.popitem(last=False)
+                return None
+            self._apply(doc)
+            return self.active.get(cntr_no) or self.closed.get(cntr_no)
+
+    def containers(self):
+        with self.lock:
+            return list(self.active.values())
+
+    def bill(self, bl_no):
+        with self.lock:
+            return [self.active[c] for c in self.by_bl.get(bl_no, ())]
+
+    def vessel(self, imo):
+        with self.lock:
+            return [self.active[c] for c in self.by_imo.get(imo, ())]
+
+
+_lock = threading.Lock()
+
+
+def get_cache():
+    """Tracking cache of current app, started on first use. Request
+    starting the cache waits for snapshot, later requests fail with
+    503 until it is loaded."""
+    app = current_app._get_current_object()
+    started = False
+    with _lock:
+        cache = app.extensions.get('tracking_cache')
+        if cache is None:
+            cache = TrackingCache(
+                app.config['DB_UPDATE'],
+                max_closed=app.config.get('TRACKING_CACHE_MAX_CLOSED', 10000),
+                max_missing=app.config.get('TRACKING_CACHE_MAX_MISSING',
+                                           10000),
+            ).start()
+            app.extensions['tracking_cache'] = cache
+            started = True
+    if started:
+        cache.ready.wait(app.config.get('TRACKING_CACHE_LOAD_TIMEOUT', 30))
+    if not cache.ready.is_set():
+        abort(503)
+    return cache
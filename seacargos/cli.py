@@ -0,0 +1,87 @@
+"""Command line interface for seacargos ETL scripts.
+
+Heavy dependencies (pymongo, requests, bs4, flask) are imported only by
+the subcommand which needs them, so short cron runs start fast.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+# Subcommand: (ETL module, module main() takes argument list, help)
+COMMANDS = {
+    'init': ('etl_init', True,
+             'start tracking containers of bills: [--carrier NAME] BILL...'),
+    'update': ('etl_update', True,
+               'update schedules of due containers: [--workers N]'),
+    'ships': ('update_ships_location', False,
+              'update locations of ships carrying tracked containers'),
+    'track-end': ('track_end', False,
+                  'end tracking of containers at destination'),
+    'crawl': ('ships_web_scrapper', False,
+              'crawl ship details into ships collection'),
+    'events': ('track_events', True,
+               'dispatch container events to sinks: [SINK...]'),
+    'migrate': ('migrate_models', False,
+                'rewrite legacy documents into compact models, required '
+                'before update, ships and track-end run'),
+    'registry': ('ships_registry', True,
+                 'ships registry: import PATH, export PATH or dedup'),
+}
+
+
+def default_etl_dir():
+    """ETL scripts directory: SEACARGOS_ETL_DIR, one-line directory of
+    source checkout or current directory."""
+    if 'SEACARGOS_ETL_DIR' in os.environ:
+        return os.environ['SEACARGOS_ETL_DIR']
+    checkout = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        'one-line',
+    )
+    if os.path.isdir(checkout):
+        return checkout
+    return os.getcwd()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='seacargos', description=__doc__)
+    parser.add_argument(
+        '--etl-dir', default=None,
+        help='directory with ETL scripts and access.py',
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for name, (_, _, help_text) in COMMANDS.items():
+        subparsers.add_parser(name, help=help_text)
+    return parser
+
+
+def parse_args(argv=None):
+    """Parse cli arguments. Return options and arguments left for
+    the subcommand module, e.g. --workers N or BILL..."""
+    parser = build_parser()
+    options, args = parser.parse_known_args(argv)
+    takes_args = COMMANDS[options.command][1]
+    if args and not takes_args:
+        parser.error(f'{options.command} takes no arguments')
+    return options, args
+
+
+def load_module(command, etl_dir=None):
+    """Import ETL module of subcommand from etl_dir."""
+    etl_dir = etl_dir or default_etl_dir()
+    if etl_dir not in sys.path:
+        sys.path.insert(0, etl_dir)
+    return importlib.import_module(COMMANDS[command][0])
+
+
+def main(argv=None):
+    options, args = parse_args(argv)
+    module = load_module(options.command, options.etl_dir)
+    if COMMANDS[options.command][1]:
+        return module.main(args)
+    return module.main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,7 @@ from flask import (
 from werkzeug.exceptions import abort
 
 #from flaskr.auth import login_required
-from ships_tracker.db import get_conn
+from seacargos.db import get_conn
 
 bp = Blueprint('home', __name__)
 
@@ -0,0 +1,32 @@
+from flask import Blueprint, jsonify
+from werkzeug.exceptions import abort
+
+from seacargos.cache import get_cache
+
+bp = Blueprint('tracking', __name__, url_prefix='/tracking')
+
+
+@bp.route('/containers')
+def containers():
+    entries = get_cache().containers()
+    return jsonify([entry.to_dict() for entry in entries])
+
+
+@bp.route('/containers/<cntr_no>')
+def container(cntr_no):
+    entry = get_cache().get(cntr_no)
+    if entry is None:
+        abort(404)
+    return jsonify(entry.to_dict())
+
+
+@bp.route('/bills/<bl_no>')
+def bill(bl_no):
+    entries = get_cache().bill(bl_no)
+    return jsonify([entry.to_dict() for entry in entries])
+
+
+@bp.route('/vessels/<int:imo>')
+def vessel(imo):
+    entries = get_cache().vessel(imo)
+    return jsonify([entry.to_dict() for entry in entries])
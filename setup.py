@@ -0,0 +1,20 @@
+from setuptools import find_packages, setup
+
+setup(
+    name='seacargos',
+    version='1.0.0',
+    packages=find_packages(),
+    include_package_data=True,
+    zip_safe=False,
+    install_requires=[
+        'beautifulsoup4',
+        'flask',
+        'pymongo',
+        'requests',
+    ],
+    entry_points={
+        'console_scripts': [
+            'seacargos = seacargos.cli:main',
+        ],
+    },
+)
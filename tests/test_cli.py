@@ -0,0 +1,70 @@
+import subprocess
+import sys
+import types
+
+import pytest
+
+from seacargos import cli
+
+
+@pytest.mark.parametrize(('argv', 'command', 'args'), [
+    (['update', '--workers', '2'], 'update', ['--workers', '2']),
+    (['init', '--carrier', 'one', 'B1', 'B2'],
+     'init', ['--carrier', 'one', 'B1', 'B2']),
+    (['init', 'B1'], 'init', ['B1']),
+    (['events', 'file', 'queue'], 'events', ['file', 'queue']),
+    (['registry', 'import', 'ships.bson'],
+     'registry', ['import', 'ships.bson']),
+    (['track-end'], 'track-end', []),
+])
+def test_parse_args(argv, command, args):
+    options, rest = cli.parse_args(argv)
+    assert options.command == command
+    assert rest == args
+
+
+def test_parse_etl_dir():
+    options, rest = cli.parse_args(['--etl-dir', '/etl', 'update'])
+    assert options.etl_dir == '/etl'
+    assert rest == []
+
+
+@pytest.mark.parametrize('argv', [
+    ['track-end', 'extra'],
+    ['crawl', '--workers', '2'],
+    ['unknown'],
+    [],
+])
+def test_parse_args_error(argv):
+    with pytest.raises(SystemExit):
+        cli.parse_args(argv)
+
+
+def fake_module(monkeypatch, name):
+    calls = []
+    module = types.ModuleType(name)
+    module.main = lambda *args: calls.append(args) or 0
+    monkeypatch.setitem(sys.modules, name, module)
+    return calls
+
+
+def test_main_passes_arguments(monkeypatch, tmp_path):
+    calls = fake_module(monkeypatch, 'etl_update')
+    assert cli.main(['--etl-dir', str(tmp_path), 'update',
+                     '--workers', '3']) == 0
+    assert calls == [(['--workers', '3'],)]
+
+
+def test_main_without_arguments(monkeypatch, tmp_path):
+    calls = fake_module(monkeypatch, 'track_end')
+    assert cli.main(['--etl-dir', str(tmp_path), 'track-end']) == 0
+    assert calls == [()]
+
+
+def test_cli_does_not_import_dependencies():
+    code = (
+        'import sys, seacargos.cli; '
+        'heavy = {"flask", "pymongo", "requests", "bs4"}; '
+        'sys.exit(len(heavy & set(sys.modules)))'
+    )
+    assert subprocess.run([sys.executable, '-c', code]).returncode == 0
@@ -0,0 +1,73 @@
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('pymongo')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'one-line'))
+import geofence  # noqa: E402
+
+SQUARE = [(0, 0), (4, 0), (4, 4), (0, 4), (0, 0)]
+HOLE = [(1, 1), (3, 1), (3, 3), (1, 3), (1, 1)]
+
+
+@pytest.mark.parametrize(('lon', 'lat', 'inside'), [
+    (2, 2, True),
+    (0.5, 3.5, True),
+    (5, 2, False),
+    (-1, 2, False),
+    (2, 4.5, False),
+])
+def test_in_ring(lon, lat, inside):
+    assert geofence.in_ring(lon, lat, SQUARE) is inside
+
+
+def test_in_ring_concave():
+    # U shape open to the north
+    ring = [(0, 0), (3, 0), (3, 3), (2, 3), (2, 1), (1, 1), (1, 3),
+            (0, 3), (0, 0)]
+    assert geofence.in_ring(0.5, 2, ring)
+    assert not geofence.in_ring(1.5, 2, ring)
+
+
+def test_fence_holes_and_multipolygon():
+    fence = geofence.Fence('Port', '', [
+        [SQUARE, HOLE],
+        [[(10, 10), (11, 10), (11, 11), (10, 11), (10, 10)]],
+    ])
+    assert fence.bbox == (0, 0, 11, 11)
+    assert fence.contains(0.5, 0.5)
+    assert not fence.contains(2, 2)
+    assert fence.contains(10.5, 10.5)
+    assert not fence.contains(7, 7)
+
+
+def test_grid_index_candidates():
+    small = geofence.Fence('Small', '', [[SQUARE]])
+    wide = geofence.Fence('Wide', '', [[
+        [(-2.5, -0.5), (2.5, -0.5), (2.5, 0.5), (-2.5, 0.5), (-2.5, -0.5)],
+    ]])
+    index = geofence.GridIndex([small, wide], cell_size=1.0)
+    assert index.cell(-0.5, 3.2) == (-1, 3)
+    assert index.candidates(3.5, 3.5) == [small]
+    assert index.candidates(-2.2, 0.2) == [wide]
+    assert set(index.candidates(0.5, 0.2)) == {small, wide}
+    assert index.candidates(20, 20) == []
+
+
+def test_arrivals():
+    port = geofence.Fence('Port', 'Terminal', [[SQUARE]])
+    other = geofence.Fence('Other', '', [[
+        [(0, 0), (1, 0), (1, 1), (0, 1), (0, 0)],
+    ]])
+    index = geofence.GridIndex([port, other])
+    positions = {1: (0.5, 0.5), 2: (2, 2), 3: (10, 10)}
+    destinations = {
+        1: {'C1': 'Port', 'C2': 'Elsewhere'},
+        2: {'C3': 'Other'},
+        3: {'C4': 'Port'},
+        4: {'C5': 'Port'},
+    }
+    assert geofence.arrivals(index, positions, destinations) == {'C1': port}
@@ -0,0 +1,90 @@
+"""Lease tests against a real MongoDB, set SEACARGOS_TEST_MONGO to its uri."""
+import multiprocessing
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+pymongo = pytest.importorskip('pymongo')
+
+URI = os.environ.get('SEACARGOS_TEST_MONGO')
+if not URI:
+    pytest.skip('SEACARGOS_TEST_MONGO is not set', allow_module_level=True)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'one-line'))
+import leases  # noqa: E402
+
+DB = 'seacargos_test'
+
+
+@pytest.fixture
+def collection():
+    conn = pymongo.MongoClient(URI)
+    collection = conn[DB].leases
+    collection.drop()
+    collection.insert_many([{'_id': i} for i in range(100)])
+    leases.ensure_indexes(collection)
+    yield collection
+    collection.drop()
+    conn.close()
+
+
+def claim_all(owner):
+    """Claim batches until nothing is left, return claimed ids."""
+    conn = pymongo.MongoClient(URI)
+    ids = []
+    try:
+        while True:
+            batch = leases.claim(conn[DB].leases, owner, {}, 7)
+            if not batch:
+                return ids
+            ids += [doc['_id'] for doc in batch]
+    finally:
+        conn.close()
+
+
+def test_claim_by_several_processes(collection):
+    owners = [f'worker-{i}' for i in range(4)]
+    with multiprocessing.get_context('spawn').Pool(len(owners)) as pool:
+        claimed = pool.map(claim_all, owners)
+    ids = [i for batch in claimed for i in batch]
+    assert sorted(ids) == list(range(100))
+    for owner, batch in zip(owners, claimed):
+        assert collection.count_documents({'leaseOwner': owner}) == len(batch)
+
+
+def test_claim_skips_leased(collection):
+    first = leases.claim(collection, 'a', {'_id': {'$lt': 10}}, 5)
+    second = leases.claim(collection, 'b', {'_id': {'$lt': 10}}, 10)
+    assert len(first) == 5 and len(second) == 5
+    assert not {d['_id'] for d in first} & {d['_id'] for d in second}
+
+
+def test_renew_only_own_leases(collection):
+    ids = [d['_id'] for d in leases.claim(collection, 'a', {}, 3)]
+    assert leases.renew(collection, 'a', ids) == 3
+    assert leases.renew(collection, 'b', ids) == 0
+    assert leases.renew(collection, 'a', []) == 0
+
+
+def test_release(collection):
+    ids = [d['_id'] for d in leases.claim(collection, 'a', {}, 3)]
+    collection.update_many({'_id': {'$in': ids}}, {'$set': {'extra': 1}})
+    assert leases.release(collection, 'b', ids) == 0
+    assert leases.release(collection, 'a', ids, unset=['extra'],
+                          done=True) == 3
+    doc = collection.find_one({'_id': ids[0]})
+    assert doc == {'_id': ids[0], 'done': True}
+
+
+def test_recover_expired(collection):
+    ids = [d['_id'] for d in leases.claim(collection, 'a', {}, 3)]
+    collection.update_one(
+        {'_id': ids[0]},
+        {'$set': {'leaseExpires': datetime.now() - timedelta(seconds=1)}},
+    )
+    assert leases.recover(collection) == 1
+    claimed = leases.claim(collection, 'b', {'_id': {'$in': ids}}, 3)
+    assert [d['_id'] for d in claimed] == ids[:1]